@@ -14,7 +14,7 @@ import DiagramsView from './components/DiagramsView.jsx';
 import AuthPage from './components/AuthPage.jsx';
 import LibraryPanel from './components/LibraryPanel.jsx';
 import api from './utils/api';
-import { setAuth, clearAuth, getToken, getStoredUser } from './utils/auth';
+import { setAuth, clearAuth, getToken, getStoredUser, getAuthHeader } from './utils/auth';
 
 function App() {
   const [user, setUser] = useState(getStoredUser());
@@ -112,6 +112,8 @@ function App() {
   };
 
   const handleLogout = () => {
+    // Send the header explicitly; the request interceptor would run after clearAuth()
+    api.post('/auth/logout', null, { headers: getAuthHeader() }).catch(() => {});
     clearAuth();
     setUser(null);
     setGraphData(null);
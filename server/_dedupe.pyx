@@ -0,0 +1,60 @@
+# distutils: language = c++
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""C-accelerated paragraph dedupe for /notes/combined.
+
+Build in place (from server/): cythonize -i -3 _dedupe.pyx
+app.py falls back to its pure-Python _dedupe_paragraphs when this isn't built.
+
+Normalisation matches the Python version (lowercase, anything outside a-z0-9
+becomes a separator, separators collapse), but it is folded straight into a
+64-bit FNV-1a hash in a single scan instead of building the normalised string.
+"""
+import re
+
+from libc.stdint cimport uint64_t
+from libcpp.unordered_set cimport unordered_set
+
+_PARA_SPLIT = re.compile(r"\n\s*\n")
+
+cdef uint64_t FNV_OFFSET = 14695981039346656037ULL
+cdef uint64_t FNV_PRIME = 1099511628211ULL
+
+
+cdef uint64_t _normalized_hash(str paragraph, bint* empty):
+    cdef uint64_t h = FNV_OFFSET
+    cdef bint pending_space = False
+    cdef bint has_token = False
+    cdef Py_UCS4 ch
+    for ch in paragraph.lower():
+        if (u'a' <= ch <= u'z') or (u'0' <= ch <= u'9'):
+            if pending_space and has_token:
+                h = (h ^ 32) * FNV_PRIME
+            pending_space = False
+            has_token = True
+            h = (h ^ <uint64_t>ch) * FNV_PRIME
+        else:
+            pending_space = True
+    empty[0] = not has_token
+    return h
+
+
+cpdef str dedupe_paragraphs(str text):
+    if not text:
+        return text
+
+    cdef unordered_set[uint64_t] seen
+    cdef list kept = []
+    cdef bint empty = False
+    cdef uint64_t key
+    cdef str paragraph
+
+    for raw in _PARA_SPLIT.split(text):
+        paragraph = raw.strip()
+        if not paragraph:
+            continue
+        key = _normalized_hash(paragraph, &empty)
+        if empty or seen.count(key):
+            continue
+        seen.insert(key)
+        kept.append(paragraph)
+    return "\n\n".join(kept)
@@ -1,7 +1,15 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+import copy
+import hashlib
 import json
+import orjson
+import os
+import threading
 import time
 import re
+import httpx
+from groq import Groq
 
 
 # Models ordered by preference; smaller ones are tried when the primary is rate-limited.
@@ -12,6 +20,28 @@ FALLBACK_MODELS = [
 ]
 
 
+_GROQ_CLIENTS = {}
+_GROQ_CLIENTS_LOCK = threading.Lock()
+
+
+def get_groq_client(api_key: str):
+    """Return the process-wide Groq client for *api_key*.
+
+    All agents share one client so its keep-alive connection pool (and the
+    TLS sessions in it) is reused across requests instead of reconnecting.
+    """
+    with _GROQ_CLIENTS_LOCK:
+        client = _GROQ_CLIENTS.get(api_key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+            client = Groq(api_key=api_key, http_client=http_client)
+            _GROQ_CLIENTS[api_key] = client
+        return client
+
+
 class _SyntheticMessage:
     """Minimal stand-in for a ChatCompletionMessage when we repair JSON ourselves."""
     def __init__(self, content: str):
@@ -34,7 +64,158 @@ class _SyntheticCompletion:
         self.model = "repaired"
 
 
-def rate_limit_retry(groq_client, create_kwargs, max_retries=3, agent_name="Agent"):
+_CACHE_WS_RE = re.compile(r"\s+")
+
+
+class LLMCache:
+    """Thread-safe in-process LRU cache for deterministic LLM results.
+
+    Keys are a SHA-256 over the request (model, whitespace/case-normalised
+    messages, response_format, max_tokens). Requests sampled above
+    temperature 0 are never cached.
+    Values are stored as plain parsed Python objects and deep-copied on the
+    way out so callers can mutate them freely.
+    """
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse whitespace and case so trivially re-formatted prompts share a key."""
+        return _CACHE_WS_RE.sub(" ", text).strip().lower()
+
+    @staticmethod
+    def make_key(create_kwargs: dict):
+        if (create_kwargs.get("temperature") or 0) > 0:
+            return None
+        payload = {
+            "model": create_kwargs.get("model"),
+            "messages": [
+                {**m, "content": LLMCache.normalize(m["content"])} if isinstance(m.get("content"), str) else m
+                for m in create_kwargs.get("messages") or []
+            ],
+            "response_format": create_kwargs.get("response_format"),
+            "max_tokens": create_kwargs.get("max_tokens"),
+        }
+        return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return copy.deepcopy(self._data[key])
+
+    def set(self, key, value):
+        if key is None or value is None:
+            return
+        with self._lock:
+            self._data[key] = copy.deepcopy(value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# Shared by every agent in the process.
+LLM_CACHE = LLMCache(maxsize=512)
+
+
+class BudgetExhausted(Exception):
+    """Raised when a model's local budget can't admit a request within max_wait."""
+
+
+class TokenBucket:
+    """Sliding-window request/token budget, tracked per model.
+
+    ``acquire`` blocks until the last minute of admitted requests leaves room
+    for the new one, so bursts queue locally instead of hitting 429 and
+    backing off. Interactive callers are admitted ahead of batch callers
+    waiting on the same model. ``limits`` maps a model to its (rpm, tpm);
+    models without an entry use the defaults, and a limit of 0 disables that
+    check. Waiting longer than ``max_wait`` seconds raises BudgetExhausted.
+    """
+    WINDOW = 60.0
+
+    def __init__(self, rpm: int, tpm: int, limits: dict = None, max_wait: float = 10.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limits = limits or {}
+        self.max_wait = max_wait
+        self._events = {}  # model -> deque of (admitted_at, tokens)
+        self._interactive_waiting = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, model: str, tokens: int, interactive: bool = False):
+        rpm, tpm = self.limits.get(model, (self.rpm, self.tpm))
+        if rpm <= 0 and tpm <= 0:
+            return
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            if interactive:
+                self._interactive_waiting[model] = self._interactive_waiting.get(model, 0) + 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    events = self._events.setdefault(model, deque())
+                    while events and now - events[0][0] >= self.WINDOW:
+                        events.popleft()
+                    used = sum(t for _, t in events)
+                    fits = (
+                        (rpm <= 0 or len(events) < rpm)
+                        # An oversized request is admitted once the window is empty
+                        and (tpm <= 0 or used + tokens <= tpm or not events)
+                    )
+                    if fits and (interactive or not self._interactive_waiting.get(model)):
+                        events.append((now, tokens))
+                        return
+                    if now >= deadline:
+                        raise BudgetExhausted(f"Local budget for '{model}' still full after {self.max_wait:.0f}s")
+                    wait = self.WINDOW - (now - events[0][0]) if events else 0.05
+                    self._cond.wait(timeout=min(max(wait, 0.05), deadline - now))
+            finally:
+                if interactive:
+                    self._interactive_waiting[model] -= 1
+                    self._cond.notify_all()
+
+
+def estimate_tokens(create_kwargs: dict) -> int:
+    """Rough prompt + completion token estimate (~4 chars per token)."""
+    chars = 0
+    for message in create_kwargs.get("messages", []):
+        content = message.get("content", "")
+        chars += len(content) if isinstance(content, str) else len(str(content))
+    return chars // 4 + (create_kwargs.get("max_tokens") or 1024)
+
+
+def _parse_model_limits(spec: str) -> dict:
+    """Parse "model=rpm:tpm,model=rpm:tpm" into {model: (rpm, tpm)}."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            model, values = item.rsplit("=", 1)
+            rpm, tpm = values.split(":")
+            limits[model.strip()] = (int(rpm), int(tpm))
+        except ValueError:
+            print(f"GROQ_MODEL_LIMITS: ignoring malformed entry '{item}'")
+    return limits
+
+
+# Off by default. The budget lives in each process, so with several gunicorn workers
+# give each one its share of the account limit, e.g. GROQ_MODEL_LIMITS=
+# "llama-3.3-70b-versatile=7:3000,llama-3.1-8b-instant=7:1500" for four workers.
+GROQ_BUDGET = TokenBucket(
+    rpm=int(os.getenv("GROQ_RPM", "0")),
+    tpm=int(os.getenv("GROQ_TPM", "0")),
+    limits=_parse_model_limits(os.getenv("GROQ_MODEL_LIMITS", "")),
+    max_wait=float(os.getenv("GROQ_BUDGET_MAX_WAIT", "10")),
+)
+
+
+def rate_limit_retry(groq_client, create_kwargs, max_retries=3, agent_name="Agent", priority="batch"):
     """Call groq_client.chat.completions.create with automatic retry + model fallback.
 
     On 429 (RateLimitError) the helper:
@@ -48,19 +229,32 @@ def rate_limit_retry(groq_client, create_kwargs, max_retries=3, agent_name="Agen
       - If repair fails, retries without ``response_format`` so the model
         returns free-form text the caller can parse.
 
+    Before every attempt the request is admitted through ``GROQ_BUDGET``;
+    pass ``priority="interactive"`` for user-facing calls so they jump ahead
+    of queued batch work. A model whose budget stays full past the wait cap
+    is skipped in favour of the next fallback.
+
     Returns the ChatCompletion on success, or raises the last exception.
     """
-    models_to_try = [create_kwargs.get("model", PRIMARY_MODEL)] + FALLBACK_MODELS
+    tokens_needed = estimate_tokens(create_kwargs)
+    interactive = priority == "interactive"
+    primary = create_kwargs.get("model", PRIMARY_MODEL)
+    models_to_try = [primary] + [m for m in FALLBACK_MODELS if m != primary]
 
     last_exc = None
     for model in models_to_try:
         kwargs = {**create_kwargs, "model": model}
         for attempt in range(1, max_retries + 1):
             try:
+                GROQ_BUDGET.acquire(model, tokens_needed, interactive)
                 result = groq_client.chat.completions.create(**kwargs)
                 if model != models_to_try[0]:
                     print(f"{agent_name}: Succeeded with fallback model '{model}' on attempt {attempt}")
                 return result
+            except BudgetExhausted as e:
+                last_exc = e
+                print(f"{agent_name}: {e}, trying next fallback …")
+                break
             except Exception as e:
                 last_exc = e
                 err_str = str(e)
@@ -75,6 +269,7 @@ def rate_limit_retry(groq_client, create_kwargs, max_retries=3, agent_name="Agen
                         print(f"{agent_name}: Retrying without response_format on '{model}'")
                         kwargs_no_fmt = {k: v for k, v in kwargs.items() if k != "response_format"}
                         try:
+                            GROQ_BUDGET.acquire(model, tokens_needed, interactive)
                             result = groq_client.chat.completions.create(**kwargs_no_fmt)
                             return result
                         except Exception:
@@ -181,6 +376,24 @@ def _repair_json(text: str) -> str | None:
         return None
 
 
+_SUBJECT_RE = re.compile(r"Subject:\s*(.*?)(?:\n|$)")
+_SUBJECT_MARKER = "Subject:"
+
+
+def extract_subject(notes_text: str, default: str = "General") -> str:
+    """Pull the value of the "Subject:" line (optionally "# Subject:") out of generated notes."""
+    if not notes_text:
+        return default
+    # Generated notes put the subject line at the top, so a plain find usually suffices
+    idx = notes_text.find(_SUBJECT_MARKER, 0, 512)
+    if idx >= 0:
+        return notes_text[idx + len(_SUBJECT_MARKER):].lstrip().partition("\n")[0].strip()
+    match = _SUBJECT_RE.search(notes_text)
+    if match:
+        return match.group(1).strip()
+    return default
+
+
 def _parse_wait_seconds(error_message: str, default: float = 30) -> float:
     """Extract 'Please try again in Xm Ys' from Groq error messages."""
     match = re.search(r"try again in\s+(?:(\d+)m)?(\d+(?:\.\d+)?)s", error_message)
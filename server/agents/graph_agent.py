@@ -1,9 +1,8 @@
-from .base_agent import BaseAgent, rate_limit_retry
+from .base_agent import BaseAgent, rate_limit_retry, get_groq_client
 import os
 import json
 import re
 from collections import Counter
-from groq import Groq
 
 class GraphAgent(BaseAgent):
     def __init__(self):
@@ -12,7 +11,7 @@ class GraphAgent(BaseAgent):
         
         self.groq_client = None
         if self.groq_key and self.groq_key != "gsk-placeholder":
-             self.groq_client = Groq(api_key=self.groq_key)
+             self.groq_client = get_groq_client(self.groq_key)
         else:
             print("GraphAgent: No GROQ_API_KEY found. Will use Heuristic Fallback.")
 
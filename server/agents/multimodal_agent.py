@@ -1,8 +1,7 @@
-from .base_agent import BaseAgent
+from .base_agent import BaseAgent, get_groq_client
 import os
 import base64
 import io
-from groq import Groq
 from pypdf import PdfReader
 from PIL import Image
 
@@ -11,13 +10,15 @@ class MultimodalAgent(BaseAgent):
         super().__init__("MultimodalAgent")
         self.groq_key = os.getenv("GROQ_API_KEY")
         self.groq_client = None
-        self.source_diagrams = []
         if self.groq_key and self.groq_key != "gsk-placeholder":
-             self.groq_client = Groq(api_key=self.groq_key)
+             self.groq_client = get_groq_client(self.groq_key)
 
     def process(self, data):
         """
         Data expectations: {'file_path': str, 'file_type': str}
+
+        Returns (text, diagrams). Diagrams are returned rather than kept on the agent,
+        which is shared by every concurrent upload.
         """
         file_path = data.get('file_path')
         file_type = data.get('file_type', 'text')
@@ -25,43 +26,44 @@ class MultimodalAgent(BaseAgent):
         if not file_path or not os.path.exists(file_path):
             raise ValueError(f"File not found: {file_path}")
 
+        diagrams = []
         try:
             # Handle Images (Vision)
             if file_type.startswith('image/'):
                 print(f"MultimodalAgent: Processing Image {file_path}")
-                self.source_diagrams.extend(self._extract_image_as_diagram(file_path))
+                diagrams.extend(self._extract_image_as_diagram(file_path))
                 if self.groq_client:
-                    return self._process_image(file_path)
+                    return self._process_image(file_path), diagrams
                 else:
-                    return "[Image Content - No API Key Provided]"
+                    return "[Image Content - No API Key Provided]", diagrams
 
             # Handle PDF
             elif file_type == 'application/pdf':
                 print(f"MultimodalAgent: Processing PDF {file_path}")
-                self.source_diagrams.extend(self._extract_pdf_images(file_path))
-                return self._extract_pdf_text(file_path)
+                diagrams.extend(self._extract_pdf_images(file_path))
+                return self._extract_pdf_text(file_path), diagrams
 
             # Handle PowerPoint
             elif file_type == 'application/vnd.openxmlformats-officedocument.presentationml.presentation':
                 print(f"MultimodalAgent: Processing PPT {file_path}")
-                self.source_diagrams.extend(self._extract_pptx_images(file_path))
-                return self._extract_pptx_text(file_path)
+                diagrams.extend(self._extract_pptx_images(file_path))
+                return self._extract_pptx_text(file_path), diagrams
 
             # Handle Audio/Video
             elif file_type.startswith('audio/') or file_type.startswith('video/'):
                 print(f"MultimodalAgent: Processing Audio/Video {file_path}")
                 if file_type.startswith('video/'):
-                    self.source_diagrams.extend(self._extract_video_frame(file_path))
-                return self._transcribe_media(file_path)
+                    diagrams.extend(self._extract_video_frame(file_path))
+                return self._transcribe_media(file_path), diagrams
             
             # Handle Text
             else:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
-                return content
+                return content, diagrams
         except Exception as e:
             print(f"Error processing file: {e}")
-            return ""
+            return "", diagrams
 
     def _extract_pdf_text(self, pdf_path):
         try:
@@ -1,8 +1,7 @@
-from .base_agent import BaseAgent, rate_limit_retry
+from .base_agent import BaseAgent, rate_limit_retry, get_groq_client, extract_subject
 import os
 import re
 import math
-from groq import Groq
 
 class NotesAgent(BaseAgent):
     def __init__(self):
@@ -10,7 +9,7 @@ class NotesAgent(BaseAgent):
         self.groq_key = os.getenv("GROQ_API_KEY")
         self.groq_client = None
         if self.groq_key and self.groq_key != "gsk-placeholder":
-             self.groq_client = Groq(api_key=self.groq_key)
+             self.groq_client = get_groq_client(self.groq_key)
         self.subject = "General"
 
     def process(self, content):
@@ -558,12 +557,4 @@ Enable API to generate prerequisites and learning path.
         """
 
     def _extract_subject_from_notes(self, notes_text: str) -> str:
-        if not notes_text:
-            return "General"
-        match = re.search(r"Subject:\s*(.*?)(?:\n|$)", notes_text)
-        if match:
-            return match.group(1).strip()
-        match = re.search(r"#\s*Subject:\s*(.*?)(?:\n|$)", notes_text)
-        if match:
-            return match.group(1).strip()
-        return "General"
+        return extract_subject(notes_text)
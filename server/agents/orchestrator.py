@@ -2,53 +2,98 @@ from .multimodal_agent import MultimodalAgent
 from .graph_agent import GraphAgent
 from .notes_agent import NotesAgent
 from .qa_agent import QAAgent
+from .base_agent import extract_subject
 from services.db_service import DBService
 from services.vector_db_service import VectorDBService
 import concurrent.futures
+import heapq
 import os
+import threading
+import time
 import uuid
 import re
+from collections import OrderedDict
+
+import numpy as np
+
+# Follow-up questions this similar to the previous one in a session reuse its retrieval;
+# kept high so a different question in the same conversation still gets fresh context
+FOLLOWUP_SIMILARITY = 0.92
+SESSION_CONTEXT_TTL = 900
+SESSION_CONTEXT_MAX = 2048
+# Top graph concepts explained during upload (one batched request per 6); 0 turns it off
+UPLOAD_CONCEPT_EXPLANATIONS = int(os.getenv("UPLOAD_CONCEPT_EXPLANATIONS", "6"))
+# Fields generate_notes_for_subject reads off the best-matching note (legacy "notes"/"graph" included)
+SUBJECT_NOTE_PROJECTION = {
+    "doc_id": 1, "notes_text": 1, "notes": 1, "graph_data": 1, "graph": 1,
+    "questions": 1, "source_diagrams": 1
+}
 
 class Orchestrator:
     def __init__(self):
         self.multimodal_agent = MultimodalAgent()
         self.graph_agent = GraphAgent()
         self.notes_agent = NotesAgent()
-        self.qa_agent = QAAgent()
+        self.qa_agent = QAAgent.instance()
         self.db_service = DBService()
         self.vector_db = VectorDBService()
+        self.qa_agent.embedder = self.vector_db.embedder
         self.default_scope = "private"
+        # (session_id, user_id, doc_id) -> {"query_vec", "note_results", "expires_at"}
+        self._session_context = OrderedDict()
+        self._session_lock = threading.Lock()
 
     
-    def handle_multiple_uploads(self, file_paths, file_types, user_id: str, scope: str = None):
+    def handle_multiple_uploads(self, file_paths, file_types, user_id: str, scope: str = None, on_indexed=None):
+        """Process uploads into a saved note.
+
+        Vector indexing finishes in the background; ``on_indexed(doc_id, ok)`` runs once it has.
+        """
         combined_text = ""
         doc_id = str(uuid.uuid4())[:8]
-        self.multimodal_agent.source_diagrams = []
         resolved_scope = scope if scope in {"private", "shared"} else self.default_scope
         
-        # 1. Process All Content
-        for path, f_type in zip(file_paths, file_types):
+        # 1. Process All Content (files are independent, so extract them in parallel)
+        def extract(path, f_type):
             print(f"Orchestrator: Processing {path} (type: {f_type})")
-            text = self.multimodal_agent.process({"file_path": path, "file_type": f_type})
+            return self.multimodal_agent.process({"file_path": path, "file_type": f_type})
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(4, len(file_paths)))) as executor:
+            extracted = list(executor.map(extract, file_paths, file_types))
+
+        # Diagrams are collected per request; the agent is shared with concurrent uploads
+        source_diagrams = []
+        for path, (text, diagrams) in zip(file_paths, extracted):
             combined_text += f"\n\n--- Source: {os.path.basename(path)} ---\n{text}"
+            source_diagrams.extend(diagrams)
 
-        combined_text = self._dedupe_text(combined_text)
+        # A single source cannot contain cross-source duplicates, so skip the extra pass.
+        if len(file_paths) > 1:
+            combined_text = self._dedupe_text(combined_text)
         
-        print(f"Orchestrator: Source diagrams extracted: {len(self.multimodal_agent.source_diagrams)}")
-        for i, diagram in enumerate(self.multimodal_agent.source_diagrams):
+        print(f"Orchestrator: Source diagrams extracted: {len(source_diagrams)}")
+        for i, diagram in enumerate(source_diagrams):
             print(f"  - Diagram {i+1}: {diagram.get('title', 'Unknown')}")
 
         # 2. Parallel Generation (Graph + Notes + QA) on Combined Text
         print("Orchestrator: Generating Knowledge Artifacts (Merged)")
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
             future_graph = executor.submit(self.graph_agent.process, combined_text)
             future_notes = executor.submit(self.notes_agent.process, combined_text)
             future_questions = executor.submit(self.qa_agent.generate_questions, combined_text, 10)
             
             graph_data = future_graph.result()
+            # Concept explanations only need the graph, so they overlap the notes/questions calls
+            labels = [c.get('label') for c in graph_data.get('concepts', []) if isinstance(c, dict)]
+            future_explanations = executor.submit(
+                self.qa_agent.generate_concept_explanations,
+                labels[:UPLOAD_CONCEPT_EXPLANATIONS],
+                combined_text
+            )
             notes_text = future_notes.result()
             questions = future_questions.result()
+            concept_explanations = future_explanations.result()
         
         # 3. Add to Vector DB for RAG
         print("Orchestrator: Adding to Vector Database")
@@ -60,11 +105,9 @@ class Orchestrator:
             "scope": resolved_scope
         }
         
-        chunk_ids = self.vector_db.add_document(combined_text, metadata, doc_id)
-        
-        # Add concepts to vector DB
+        # Chunk once up front so the splitter/dedupe pass is not repeated downstream
+        chunks = self.vector_db.chunk_text(combined_text) if self.vector_db.index else []
         concepts = graph_data.get('concepts', [])
-        concept_ids = self.vector_db.add_concepts(concepts, metadata, doc_id)
         
         # 4. Save to MongoDB
         note_data = {
@@ -72,12 +115,22 @@ class Orchestrator:
             "graph": graph_data,
             "notes": notes_text,
             "questions": questions,
-            "diagrams": self.multimodal_agent.source_diagrams,
-            "subject": self.notes_agent.subject if hasattr(self.notes_agent, 'subject') else "General",
-            "source_diagrams": self.multimodal_agent.source_diagrams,
+            "concept_explanations": concept_explanations,
+            "diagrams": source_diagrams,
+            # Same extraction NotesAgent stores on itself, but read from this request's notes
+            "subject": metadata["subject"],
+            "source_diagrams": source_diagrams,
             "user_id": user_id,
             "scope": resolved_scope
         }
+
+        # Embedding + upserting runs on the vector DB's background pool; the response only
+        # waits for the MongoDB save, and the chunks become searchable a moment later
+        index_futures = [
+            self.vector_db.add_document_async(combined_text, metadata, doc_id, chunks),
+            self.vector_db.add_concepts_async(concepts, metadata, doc_id)
+        ]
+        self._watch_indexing(doc_id, index_futures, on_indexed)
         self.db_service.save_note(note_data, doc_id)
 
         return {
@@ -86,11 +139,35 @@ class Orchestrator:
             "graph": graph_data,
             "notes": notes_text,
             "questions": questions,
-            "source_diagrams": self.multimodal_agent.source_diagrams,
-            "chunk_count": len(chunk_ids),
-            "concept_count": len(concept_ids)
+            "concept_explanations": concept_explanations,
+            "source_diagrams": source_diagrams,
+            "chunk_count": len(chunks),
+            "concept_count": len(concepts),
+            "indexing": "queued"
         }
 
+    def _watch_indexing(self, doc_id: str, futures: list, on_indexed=None):
+        """Log background indexing failures and call on_indexed(doc_id, ok) after the last job finishes."""
+        lock = threading.Lock()
+        remaining = [len(futures)]
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            for error in errors:
+                print(f"Orchestrator: Background indexing failed for {doc_id}: {error}")
+            if on_indexed:
+                try:
+                    on_indexed(doc_id, not errors)
+                except Exception as e:
+                    print(f"Orchestrator: on_indexed callback failed for {doc_id}: {e}")
+
+        for future in futures:
+            future.add_done_callback(done)
+
     def _dedupe_text(self, text: str) -> str:
         if not text:
             return text
@@ -143,15 +220,9 @@ class Orchestrator:
             notes_text = "\n\n".join(chunks).strip()
 
         # Also try MongoDB for richer artifacts (graph/questions) if available
-        notes = self.db_service.search_notes_by_subject(subject, user_id, is_admin, scope)
-        note = None
-        if notes:
-            notes_sorted = sorted(
-                notes,
-                key=lambda n: n.get("updated_at") or n.get("created_at") or 0,
-                reverse=True
-            )
-            note = notes_sorted[0]
+        notes = self.db_service.search_notes_by_subject(subject, user_id, is_admin, scope, SUBJECT_NOTE_PROJECTION)
+        # Results come back best match first (newest among equals)
+        note = notes[0] if notes else None
 
         if not notes_text and note:
             notes_text = note.get("notes_text") or note.get("notes") or ""
@@ -178,13 +249,9 @@ class Orchestrator:
         print(f"get_quiz_questions: Looking for questions for {subject}")
         
         # Step 1: Check if questions already exist in MongoDB for this subject
-        notes = self.db_service.search_notes_by_subject(subject, user_id, is_admin, scope)
+        notes = self.db_service.search_notes_by_subject(subject, user_id, is_admin, scope, {"questions": 1})
         if notes:
-            note = sorted(
-                notes,
-                key=lambda n: n.get("updated_at") or n.get("created_at") or 0,
-                reverse=True
-            )[0]
+            note = notes[0]
             
             stored_questions = note.get("questions", [])
             print(f"get_quiz_questions: Found {len(stored_questions)} stored questions for {subject}")
@@ -362,9 +429,11 @@ class Orchestrator:
         # Get related content
         related = self._scoped_rag_search(concept_label, "notes", 3, doc_id, None, user_id, is_admin)
         
-        # Generate detailed explanation
-        context = "\n".join([r.get('content', '') for r in related[:2]])
-        explanation = self.qa_agent.generate_concept_explanation(concept_label, context)
+        # Reuse the explanation generated at upload time when the note has one
+        explanation = self._stored_concept_explanation(concept_label, doc_id, user_id, is_admin)
+        if explanation is None:
+            context = "\n".join([r.get('content', '') for r in related[:2]])
+            explanation = self.qa_agent.generate_concept_explanation(concept_label, context)
         
         return {
             "concept": concept_label,
@@ -372,16 +441,65 @@ class Orchestrator:
             "related_content": related
         }
     
-    def answer_user_question(self, question: str, user_id: str, doc_id: str = None, is_admin: bool = False) -> dict:
+    def _stored_concept_explanation(self, concept_label: str, doc_id: str, user_id: str, is_admin: bool):
+        if not doc_id:
+            return None
+        note = self.db_service.get_note_by_id(doc_id, user_id, is_admin)
+        stored = (note or {}).get("concept_explanations") or {}
+        wanted = concept_label.strip().lower()
+        for label, explanation in stored.items():
+            # Entries from a failed upload-time call are regenerated instead of served
+            if label.strip().lower() == wanted and not (explanation or {}).get("error"):
+                return explanation
+        return None
+
+    def answer_user_question(self, question: str, user_id: str, doc_id: str = None, is_admin: bool = False, session_id: str = None) -> dict:
         """Answer a user question using RAG."""
         print(f"Orchestrator: Answering question: '{question}'")
         
-        # Search for relevant context
-        search_results = self.search_knowledge_base(question, user_id, doc_id, is_admin)
-        note_results = search_results.get('note_results', [])
+        note_results, context, early = self._prepare_question_context(question, user_id, doc_id, is_admin, session_id)
+        if early:
+            return early
+        
+        # Generate answer
+        answer = self.qa_agent.answer_question(question, context)
+        
+        return {
+            "question": question,
+            "answer": answer,
+            "sources": note_results,
+            "insufficient_context": False
+        }
+
+    def stream_user_question(self, question: str, user_id: str, doc_id: str = None, is_admin: bool = False, session_id: str = None):
+        """Answer a user question using RAG, yielding (event, payload) pairs as the answer streams."""
+        print(f"Orchestrator: Streaming answer for question: '{question}'")
+
+        note_results, context, early = self._prepare_question_context(question, user_id, doc_id, is_admin, session_id)
+        if early:
+            yield "delta", early["answer"]
+            yield "done", {"sources": early["sources"], "insufficient_context": True}
+            return
+
+        for delta in self.qa_agent.answer_question(question, context, stream=True):
+            yield "delta", delta
+        yield "done", {"sources": note_results, "insufficient_context": False}
+
+    def _prepare_question_context(self, question: str, user_id: str, doc_id: str = None, is_admin: bool = False, session_id: str = None):
+        """Retrieve context for a question.
+
+        Returns (note_results, context, early_response); early_response is set when
+        the retrieved context is too weak to answer from.
+        """
+        note_results = self._session_followup_results(question, user_id, doc_id, session_id)
+        if note_results is None:
+            # Search for relevant context
+            search_results = self.search_knowledge_base(question, user_id, doc_id, is_admin)
+            note_results = search_results.get('note_results', [])
+            self._remember_session_results(question, user_id, doc_id, session_id, note_results)
 
         if not note_results:
-            return {
+            return note_results, "", {
                 "question": question,
                 "answer": "I couldn't find relevant information in the document to answer this question. Try asking something related to the uploaded content.",
                 "sources": [],
@@ -391,7 +509,7 @@ class Orchestrator:
         top_score = max(r.get('distance', 0) for r in note_results)
         relevance_threshold = 0.25
         if top_score < relevance_threshold:
-            return {
+            return note_results, "", {
                 "question": question,
                 "answer": "The question seems unrelated to the uploaded document, so I cannot answer it reliably. Please ask something tied to the document content.",
                 "sources": note_results[:3],
@@ -402,27 +520,57 @@ class Orchestrator:
         context = "\n\n".join([
             r.get('content', '') for r in note_results[:3]
         ])
-        
-        # Generate answer
-        answer = self.qa_agent.answer_question(question, context)
-        
-        return {
-            "question": question,
-            "answer": answer,
-            "sources": note_results,
-            "insufficient_context": False
-        }
+        return note_results, context, None
     
+    def _embed_question(self, question: str):
+        embedder = getattr(self.vector_db, "embedder", None)
+        if embedder is None:
+            return None
+        return embedder.encode([question], normalize_embeddings=True)[0]
+
+    def _session_followup_results(self, question: str, user_id: str, doc_id: str, session_id: str):
+        """Return the previous retrieval of this session if the question is a close follow-up."""
+        if not session_id:
+            return None
+        key = (session_id, user_id, doc_id)
+        with self._session_lock:
+            entry = self._session_context.get(key)
+        if not entry or entry["expires_at"] <= time.time():
+            return None
+        try:
+            query_vec = self._embed_question(question)
+        except Exception as e:
+            print(f"Orchestrator: Session context lookup failed: {e}")
+            return None
+        if query_vec is None or float(np.dot(query_vec, entry["query_vec"])) < FOLLOWUP_SIMILARITY:
+            return None
+        print("Orchestrator: Reusing session context for follow-up question")
+        return list(entry["note_results"])
+
+    def _remember_session_results(self, question: str, user_id: str, doc_id: str, session_id: str, note_results: list):
+        if not session_id or not note_results:
+            return
+        try:
+            query_vec = self._embed_question(question)
+        except Exception as e:
+            print(f"Orchestrator: Session context store failed: {e}")
+            return
+        if query_vec is None:
+            return
+        key = (session_id, user_id, doc_id)
+        with self._session_lock:
+            self._session_context[key] = {
+                "query_vec": query_vec,
+                "note_results": list(note_results),
+                "expires_at": time.time() + SESSION_CONTEXT_TTL
+            }
+            self._session_context.move_to_end(key)
+            while len(self._session_context) > SESSION_CONTEXT_MAX:
+                self._session_context.popitem(last=False)
+
     def _extract_subject(self, notes_text: str) -> str:
         """Extract subject from notes text."""
-        import re
-        match = re.search(r"Subject:\s*(.*?)(?:\n|$)", notes_text)
-        if match:
-            return match.group(1).strip()
-        match = re.search(r"#\s*Subject:\s*(.*?)(?:\n|$)", notes_text)
-        if match:
-            return match.group(1).strip()
-        return "General"
+        return extract_subject(notes_text)
 
     def _scoped_rag_search(
         self,
@@ -523,7 +671,7 @@ class Orchestrator:
             seen.add(item_id)
             merged.append(item)
 
-        merged.sort(key=lambda x: x.get("distance", 0), reverse=True)
-        return merged[:limit]
+        # "distance" holds Pinecone's cosine score (higher is closer), so keep the top-k largest.
+        return heapq.nlargest(limit, merged, key=lambda x: x.get("distance", 0))
 
 
@@ -1,15 +1,161 @@
-from .base_agent import BaseAgent, rate_limit_retry
+from .base_agent import BaseAgent, rate_limit_retry, get_groq_client, LLM_CACHE
 import os
-import json
-from groq import Groq
+import orjson
+import hashlib
+import threading
+import concurrent.futures
+import numpy as np
+from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+# Per-call model tiers; short interactive questions go to the instant model.
+SPEED_MAP = {
+    "instant": "llama-3.1-8b-instant",
+    "balanced": "llama-3.3-70b-versatile",
+}
+
+
+# Kept compact: prompt tokens drive time-to-first-token on every call.
+QUESTIONS_SYSTEM_PROMPT = (
+    "Create {n} multiple choice questions that test understanding and application of the content, "
+    "mixing easy, medium and hard. Return only JSON: "
+    '{{"questions": [{{"question": str, "options": [4 strings], "correct_answer": 0-3, '
+    '"explanation": str, "explanation_long": str (richer, step-by-step), '
+    '"learning_suggestion": str (actionable), "topic": str, "category": str, '
+    '"difficulty": "easy"|"medium"|"hard"}}]}}'
+)
+
+# Schema-constrained decoding guarantees the shape, so the prompt no longer spells it out.
+# Only some Groq models accept json_schema, hence the opt-in flag.
+STRUCTURED_OUTPUTS = os.getenv("GROQ_STRUCTURED_OUTPUTS") == "1"
+QUESTIONS_SCHEMA_PROMPT = (
+    "Create {n} multiple choice questions that test understanding and application of the content, "
+    "mixing easy, medium and hard. explanation_long is richer than explanation; "
+    "learning_suggestion is actionable."
+)
+_MCQ_STRING_FIELDS = [
+    "question", "explanation", "explanation_long", "learning_suggestion", "topic", "category"
+]
+QUESTIONS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "mcq_list",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "questions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            **{field: {"type": "string"} for field in _MCQ_STRING_FIELDS},
+                            "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+                            "correct_answer": {"type": "integer", "minimum": 0, "maximum": 3},
+                            "difficulty": {"type": "string", "enum": ["easy", "medium", "hard"]},
+                        },
+                        "required": _MCQ_STRING_FIELDS + ["options", "correct_answer", "difficulty"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["questions"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+class MCQ(BaseModel):
+    """One generated multiple choice question, normalised to the shape the client expects."""
+    model_config = ConfigDict(extra="ignore")
+
+    question: str = ""
+    options: List[str] = Field(min_length=1)
+    correct_answer: int = 0
+    explanation: str = ""
+    explanation_long: Optional[str] = None
+    learning_suggestion: str = ""
+    topic: Optional[str] = None
+    category: str = "General"
+    difficulty: str = "medium"
+
+    @field_validator("correct_answer", mode="before")
+    @classmethod
+    def _coerce_answer(cls, value):
+        return value if isinstance(value, int) and not isinstance(value, bool) else 0
+
+    @model_validator(mode="after")
+    def _fill_defaults(self):
+        if self.correct_answer < 0 or self.correct_answer >= len(self.options):
+            self.correct_answer = 0
+        if self.explanation_long is None:
+            self.explanation_long = self.explanation
+        if self.topic is None:
+            self.topic = self.category
+        return self
+
+
+class MCQList(BaseModel):
+    questions: List[MCQ]
+
+
+class SemanticAnswerCache:
+    """Reuses answers for paraphrased questions asked against the same context.
+
+    Question embeddings are L2-normalised, so cosine similarity is a single
+    matrix-vector product over the stored rows.
+    """
+    def __init__(self, threshold: float = 0.92, maxsize: int = 1024):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._vectors = None
+        self._entries = []  # (context_hash, answer), row-aligned with _vectors
+        self._lock = threading.Lock()
+
+    def lookup(self, q_emb, context_hash: str):
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                return None
+            sims = self._vectors @ q_emb
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                if self._entries[idx][0] == context_hash:
+                    return self._entries[idx][1]
+            return None
+
+    def add(self, q_emb, context_hash: str, answer: str):
+        with self._lock:
+            row = np.asarray(q_emb, dtype=np.float32).reshape(1, -1)
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._entries.append((context_hash, answer))
+            if len(self._entries) > self.maxsize:
+                self._vectors = self._vectors[1:]
+                self._entries.pop(0)
+
 
 class QAAgent(BaseAgent):
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """Return the process-wide QAAgent so its client and caches stay warm across requests."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
     def __init__(self):
         super().__init__("QAAgent")
         self.groq_key = os.getenv("GROQ_API_KEY")
         self.groq_client = None
         if self.groq_key and self.groq_key != "gsk-placeholder":
-            self.groq_client = Groq(api_key=self.groq_key)
+            self.groq_client = get_groq_client(self.groq_key)
+        # Set by the orchestrator to the vector DB's SentenceTransformer so the model is loaded once
+        self.embedder = None
+        self.answer_cache = SemanticAnswerCache()
 
     def process(self, content):
         """
@@ -39,83 +185,34 @@ class QAAgent(BaseAgent):
             return self._fallback_questions()
 
         try:
-            chat_completion = rate_limit_retry(
-                self.groq_client,
-                dict(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": f"""You are an expert educator creating high-quality multiple choice quiz questions.
-
-Generate {num_questions} multiple choice questions about the provided content.
-Each question must have 4 options (A, B, C, D) and one correct answer.
-Include a mix of easy, medium, and hard difficulties.
-
-Return ONLY a JSON object with this exact structure:
-{{
-    "questions": [
-        {{
-            "question": "What is...?",
-            "options": ["Option A text", "Option B text", "Option C text", "Option D text"],
-            "correct_answer": 0,
-            "explanation": "Short explanation",
-            "explanation_long": "Longer, step-by-step explanation",
-            "learning_suggestion": "What to review if the learner got this wrong",
-            "topic": "Specific topic",
-            "category": "Topic Name",
-            "difficulty": "easy|medium|hard"
-        }}
-    ]
-}}
-
-IMPORTANT:
-- options must be a list of 4 strings (NOT objects)
-- correct_answer must be 0, 1, 2, or 3
-- explanation_long should be richer than explanation
-- learning_suggestion should be actionable
-- Make questions test understanding and application, not just memorization"""
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Generate {num_questions} multiple choice questions from this content:\n\n{content[:8000]}"
-                        }
-                    ],
-                    model="llama-3.3-70b-versatile",
-                    response_format={"type": "json_object"}
-                ),
-                agent_name="QAAgent"
+            create_kwargs = dict(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": (QUESTIONS_SCHEMA_PROMPT if STRUCTURED_OUTPUTS else QUESTIONS_SYSTEM_PROMPT).format(n=num_questions)
+                    },
+                    {
+                        "role": "user",
+                        "content": f"Generate {num_questions} multiple choice questions from this content:\n\n{content[:8000]}"
+                    }
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0,
+                max_tokens=min(400 * num_questions, 4096),
+                response_format=QUESTIONS_RESPONSE_FORMAT if STRUCTURED_OUTPUTS else {"type": "json_object"}
             )
-            result = json.loads(chat_completion.choices[0].message.content or '{}')
-            questions = result.get('questions', []) if isinstance(result, dict) else result
-            
-            # Validate and fix questions
-            validated_questions = []
-            for q in questions:
-                if isinstance(q, dict):
-                    # Ensure options is a list of strings
-                    options = q.get('options', [])
-                    if not isinstance(options, list) or len(options) == 0:
-                        print(f"QAAgent: Skipping question with invalid options: {q.get('question')[:50]}")
-                        continue
-                    
-                    # Ensure correct_answer is a valid index
-                    correct_answer = q.get('correct_answer', 0)
-                    if not isinstance(correct_answer, int) or correct_answer < 0 or correct_answer >= len(options):
-                        correct_answer = 0
-                    
-                    validated_questions.append({
-                        "question": q.get("question", ""),
-                        "options": options,
-                        "correct_answer": correct_answer,
-                        "explanation": q.get("explanation", ""),
-                        "explanation_long": q.get("explanation_long", q.get("explanation", "")),
-                        "learning_suggestion": q.get("learning_suggestion", ""),
-                        "topic": q.get("topic", q.get("category", "General")),
-                        "category": q.get("category", "General"),
-                        "difficulty": q.get("difficulty", "medium")
-                    })
+            cache_key = LLM_CACHE.make_key(create_kwargs)
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                print(f"QAAgent: Using {len(cached)} cached questions")
+                return cached
+
+            chat_completion = rate_limit_retry(self.groq_client, create_kwargs, agent_name="QAAgent")
+            validated_questions = self._validate_questions(chat_completion.choices[0].message.content or '{}')
             
             print(f"QAAgent: Generated {len(validated_questions)} valid multiple choice questions")
+            if validated_questions:
+                LLM_CACHE.set(cache_key, validated_questions)
             return validated_questions if len(validated_questions) > 0 else self._fallback_questions()
         except Exception as e:
             print(f"QAAgent: Question generation error: {e}")
@@ -123,49 +220,142 @@ IMPORTANT:
             traceback.print_exc()
             return self._fallback_questions()
 
-    def answer_question(self, question: str, context: str) -> str:
+    def _validate_questions(self, raw: str) -> list:
+        """Validate the model's JSON in one pass, falling back to per-question checks."""
+        try:
+            return [q.model_dump() for q in MCQList.model_validate_json(raw).questions]
+        except ValidationError:
+            pass
+
+        result = orjson.loads(raw)
+        questions = result.get('questions', []) if isinstance(result, dict) else result
+        validated = []
+        for q in questions if isinstance(questions, list) else []:
+            try:
+                validated.append(MCQ.model_validate(q).model_dump())
+            except ValidationError:
+                question = q.get('question') if isinstance(q, dict) else None
+                print(f"QAAgent: Skipping invalid question: {str(question)[:50]}")
+        return validated
+
+    def answer_question(self, question: str, context: str, stream: bool = False):
         """
         Answer a question based on provided context.
         
         Args:
             question: The question to answer
             context: Relevant context/content to base answer on
+            stream: Return a generator of text deltas instead of the full answer
             
         Returns:
-            Detailed answer with explanation
+            Detailed answer with explanation (or a generator of its pieces when streaming)
         """
+        if stream:
+            return self._stream_answer(question, context)
+
         if not self.groq_client:
             return "Please enable API for question answering."
 
         try:
-            chat_completion = rate_limit_retry(
-                self.groq_client,
-                dict(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": """You are an expert tutor providing detailed, clear explanations.
+            q_emb, context_hash, cached = self._lookup_cached_answer(question, context)
+            if cached is not None:
+                return cached
+
+            create_kwargs = self._answer_request(question, context)
+            cache_key = LLM_CACHE.make_key(create_kwargs)
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+            chat_completion = rate_limit_retry(self.groq_client, create_kwargs, agent_name="QAAgent", priority="interactive")
+            answer = chat_completion.choices[0].message.content
+            self._store_answer(cache_key, q_emb, context_hash, answer)
+            return answer
+        except Exception as e:
+            print(f"QAAgent: Answer error: {e}")
+            return f"Unable to generate answer. Error: {str(e)}"
+
+    def _stream_answer(self, question: str, context: str):
+        """Yield the answer as it is generated so callers can forward tokens immediately."""
+        if not self.groq_client:
+            yield "Please enable API for question answering."
+            return
+
+        try:
+            q_emb, context_hash, cached = self._lookup_cached_answer(question, context)
+            if cached is not None:
+                yield cached
+                return
+
+            create_kwargs = self._answer_request(question, context)
+            cache_key = LLM_CACHE.make_key(create_kwargs)
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+            completion = rate_limit_retry(
+                self.groq_client, {**create_kwargs, "stream": True}, agent_name="QAAgent", priority="interactive"
+            )
+            parts = []
+            for chunk in completion:
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            self._store_answer(cache_key, q_emb, context_hash, "".join(parts))
+        except Exception as e:
+            print(f"QAAgent: Streaming answer error: {e}")
+            yield f"Unable to generate answer. Error: {str(e)}"
+
+    def _lookup_cached_answer(self, question: str, context: str):
+        """Return (question embedding, context hash, semantically cached answer or None)."""
+        q_emb = None
+        context_hash = hashlib.sha256(context[:6000].encode()).hexdigest()
+        if self.embedder is not None:
+            q_emb = self.embedder.encode([question], normalize_embeddings=True)[0]
+            cached = self.answer_cache.lookup(q_emb, context_hash)
+            if cached is not None:
+                print("QAAgent: Semantic cache hit for question")
+                return q_emb, context_hash, cached
+        return q_emb, context_hash, None
+
+    def _store_answer(self, cache_key, q_emb, context_hash: str, answer: str):
+        if not answer:
+            return
+        LLM_CACHE.set(cache_key, answer)
+        if q_emb is not None:
+            self.answer_cache.add(q_emb, context_hash, answer)
+
+    def _answer_request(self, question: str, context: str) -> dict:
+        return dict(
+            messages=[
+                {
+                    "role": "system",
+                    "content": """You are an expert tutor providing detailed, clear explanations.
                         Answer the question comprehensively using the provided context.
                         Include examples, reasoning, and any relevant diagrams in markdown format."""
-                        },
-                        {
-                            "role": "user",
-                            "content": f"""Question: {question}
+                },
+                {
+                    "role": "user",
+                    "content": f"""Question: {question}
                         
 Context:
 {context[:6000]}
 
 Provide a detailed, educational answer."""
-                        }
-                    ],
-                    model="llama-3.3-70b-versatile",
-                ),
-                agent_name="QAAgent"
-            )
-            return chat_completion.choices[0].message.content
-        except Exception as e:
-            print(f"QAAgent: Answer error: {e}")
-            return f"Unable to generate answer. Error: {str(e)}"
+                }
+            ],
+            model=SPEED_MAP[self._answer_tier(question, context)],
+            temperature=0,
+            max_tokens=1200,
+        )
+
+    def _answer_tier(self, question: str, context: str) -> str:
+        """Route short questions over small contexts to the faster model."""
+        if len(question) < 200 and len(context) < 1500:
+            return "instant"
+        return "balanced"
 
     def generate_concept_explanation(self, concept: str, content: str) -> dict:
         """
@@ -187,36 +377,42 @@ Provide a detailed, educational answer."""
             }
 
         try:
-            chat_completion = rate_limit_retry(
-                self.groq_client,
-                dict(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": """You are an expert educator explaining concepts.
+            create_kwargs = dict(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": """You are an expert educator explaining concepts.
                         Return ONLY a JSON object with:
                         - explanation: Detailed explanation of the concept
                         - examples: 2-3 real-world examples
                         - relatedConcepts: 3-5 related concepts
                         - importance: Why this concept matters
                         - commonMisunderstandings: Common mistakes about this concept"""
-                        },
-                        {
-                            "role": "user",
-                            "content": f"""Explain the concept: {concept}
+                    },
+                    {
+                        "role": "user",
+                        "content": f"""Explain the concept: {concept}
                         
 Based on this content:
 {content[:5000]}
 
 Provide a comprehensive explanation."""
-                        }
-                    ],
-                    model="llama-3.3-70b-versatile",
-                    response_format={"type": "json_object"}
-                ),
-                agent_name="QAAgent"
+                    }
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0,
+                max_tokens=900,
+                response_format={"type": "json_object"}
             )
-            return json.loads(chat_completion.choices[0].message.content or '{}')
+            cache_key = LLM_CACHE.make_key(create_kwargs)
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+            chat_completion = rate_limit_retry(self.groq_client, create_kwargs, agent_name="QAAgent")
+            explanation = orjson.loads(chat_completion.choices[0].message.content or '{}')
+            LLM_CACHE.set(cache_key, explanation)
+            return explanation
         except Exception as e:
             print(f"QAAgent: Concept explanation error: {e}")
             return {
@@ -225,6 +421,97 @@ Provide a comprehensive explanation."""
                 "error": str(e)
             }
 
+    def generate_concept_explanations_batch(self, concepts: list, content: str) -> dict:
+        """
+        Explain several concepts in a single LLM request.
+
+        The system prompt and shared content are sent once instead of once per
+        concept. Concepts the model leaves out of its response are explained
+        individually.
+
+        Returns:
+            Dict mapping each concept to its explanation dict
+        """
+        concepts = [c for c in dict.fromkeys(concepts or []) if c]
+        if not concepts:
+            return {}
+        if not self.groq_client or len(concepts) == 1:
+            return {c: self.generate_concept_explanation(c, content) for c in concepts}
+
+        explanations = {}
+        try:
+            create_kwargs = dict(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": """You are an expert educator explaining concepts.
+                        Return ONLY a JSON object {"explanations": {"<concept>": {...}}} with one entry
+                        for every requested concept, keyed by the concept exactly as given. Each entry has:
+                        - explanation: Detailed explanation of the concept
+                        - examples: 2-3 real-world examples
+                        - relatedConcepts: 3-5 related concepts
+                        - importance: Why this concept matters
+                        - commonMisunderstandings: Common mistakes about this concept"""
+                    },
+                    {
+                        "role": "user",
+                        "content": f"""Concepts: {orjson.dumps(concepts).decode()}
+
+Content:
+{content[:5000]}"""
+                    }
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0,
+                max_tokens=min(900 * len(concepts), 4096),
+                response_format={"type": "json_object"}
+            )
+            cache_key = LLM_CACHE.make_key(create_kwargs)
+            cached = LLM_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+
+            chat_completion = rate_limit_retry(self.groq_client, create_kwargs, agent_name="QAAgent")
+            result = orjson.loads(chat_completion.choices[0].message.content or '{}')
+            batch = result.get("explanations", {}) if isinstance(result, dict) else {}
+            if isinstance(batch, dict):
+                explanations = {c: batch[c] for c in concepts if isinstance(batch.get(c), dict)}
+        except Exception as e:
+            print(f"QAAgent: Batch concept explanation error: {e}")
+
+        missing = [c for c in concepts if c not in explanations]
+        if missing:
+            print(f"QAAgent: Batch response missing {len(missing)} concepts, explaining individually")
+        for concept in missing:
+            explanations[concept] = self.generate_concept_explanation(concept, content)
+
+        if not missing:
+            LLM_CACHE.set(cache_key, explanations)
+        return explanations
+
+    def generate_concept_explanations(self, concepts: list, content: str, max_workers: int = 8, batch_size: int = 6) -> dict:
+        """
+        Explain several concepts concurrently.
+
+        Concepts are grouped into batches of ``batch_size`` per request and the
+        batches run in parallel, so N explanations cost roughly one slow call.
+        ``max_workers`` bounds how many requests are in flight to stay inside
+        the rate limit.
+
+        Returns:
+            Dict mapping each concept to its explanation dict
+        """
+        concepts = [c for c in dict.fromkeys(concepts or []) if c]
+        if not concepts:
+            return {}
+
+        batches = [concepts[i:i + batch_size] for i in range(0, len(concepts), batch_size)]
+        explanations = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            for batch_result in executor.map(lambda b: self.generate_concept_explanations_batch(b, content), batches):
+                explanations.update(batch_result)
+        return explanations
+
     def _fallback_questions(self) -> list:
         """Fallback multiple choice questions when API is unavailable."""
         return [
@@ -1,22 +1,98 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Request, request, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
 import os
 import re
-import jwt
-from datetime import datetime, timedelta
+import shutil
+import hmac
+import base64
+import orjson
+import time
+import hashlib
+import threading
+import logging
+import uuid
+import tempfile
+from collections import OrderedDict
+from datetime import datetime
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from werkzeug.utils import secure_filename
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError, VerifyMismatchError
 from agents.orchestrator import Orchestrator
 from services.web_search_service import WebSearchService
+from services.semantic_cache_service import SemanticCacheService
 from config import Config
 
 # Load environment variables
 load_dotenv()
 
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("autonotex")
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC
+
+def _json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Routes Flask's JSON handling (jsonify, request.json) through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return _dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(_dumps(obj), mimetype=self.mimetype)
+
+class UploadRequest(Request):
+    """Spools large multipart file parts inside UPLOAD_FOLDER so uploads can be linked into place."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= 500 * 1024:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return tempfile.NamedTemporaryFile("wb+", dir=Config.UPLOAD_FOLDER, prefix=".spool-", suffix=".part")
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.json = OrjsonProvider(app)
 CORS(app, supports_credentials=True)
+
+def ojsonify(obj, status: int = 200):
+    # orjson already returns UTF-8 bytes, so the body is handed to the response as-is
+    return app.response_class(_dumps(obj), status=status, mimetype='application/json')
+
+def _sse_event(event: str, payload) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + _dumps(payload) + b"\n\n"
 Config.init_app(app)
+Compress(app)
+# Only the auth routes are limited, so password hashing can't be used to saturate HASH_POOL
+limiter = Limiter(get_remote_address, app=app, storage_uri=Config.RATELIMIT_STORAGE_URI)
+
+# Settings read on every auth request, normalised once
+_ADMIN_EMAIL_LC = (Config.ADMIN_EMAIL or "").strip().lower()
+_ADMIN_PASSWORD = (Config.ADMIN_PASSWORD or "").encode()
+_JWT_EXPIRES_SECONDS = int(Config.JWT_EXPIRES_MIN) * 60
 
 orchestrator = Orchestrator()
 
@@ -24,164 +100,533 @@ orchestrator = Orchestrator()
 _groq_client = getattr(orchestrator.qa_agent, 'groq_client', None)
 web_search = WebSearchService(groq_client=_groq_client)
 
+# Reuses RAG responses for semantically equivalent queries (/search, /question, /concept)
+semantic_cache = SemanticCacheService(orchestrator.vector_db.embedder)
+
+def _source_doc_ids(*result_lists) -> set:
+    return {
+        (r.get("metadata") or {}).get("doc_id")
+        for results in result_lists for r in (results or [])
+        if (r.get("metadata") or {}).get("doc_id")
+    }
+
+def _warm_quiz_cache():
+    """Pre-generate shared-scope quiz questions so the first quiz request per subject is a cache hit.
+
+    Runs sequentially (one Groq call at a time) at batch priority so live traffic is admitted first.
+    """
+    subjects = orchestrator.db_service.get_all_subjects(None, False, "shared")
+    logger.info("Cache warm-up: preparing quiz questions for %d shared subjects", len(subjects))
+    for subject in subjects:
+        try:
+            orchestrator.get_quiz_questions(subject, None, False, Config.WARM_QUIZ_COUNT, "shared")
+        except Exception as e:
+            logger.warning("Cache warm-up: failed for '%s': %s", subject, e)
+    logger.info("Cache warm-up: done")
+
+if Config.WARM_QUIZ_CACHE and _groq_client:
+    threading.Thread(target=_warm_quiz_cache, name="quiz-cache-warmup", daemon=True).start()
+
+# Shared pool for blocking file I/O so multi-file uploads are written concurrently
+IO_POOL = ThreadPoolExecutor(max_workers=8)
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Linux: uploads are written to an anonymous O_TMPFILE inode in this directory and
+# linked into place when complete; the dirfd is opened once and shared by every upload
+_UPLOAD_DIR_FD = os.open(Config.UPLOAD_FOLDER, os.O_RDONLY | os.O_DIRECTORY) if hasattr(os, 'O_TMPFILE') else None
+
+def _upload_path(filename: str) -> str:
+    return os.path.join(Config.UPLOAD_FOLDER, secure_filename(filename or '') or 'upload')
+
+def _copy_stream(file, fd: int):
+    with open(fd, 'wb', buffering=0, closefd=False) as out:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        shutil.copyfileobj(file.stream, out, length=UPLOAD_CHUNK_SIZE)
+
+def _save_upload(file, filepath: str) -> str:
+    """
+    Stream an uploaded file to disk in fixed-size chunks to keep memory bounded.
+
+    The file only appears under its final name once fully written, so a client
+    disconnect never leaves a truncated upload behind.
+    """
+    tmp_path = os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.{uuid.uuid4().hex}.part")
+
+    # Werkzeug already wrote large parts to a spool file in this folder: hard-link it
+    # instead of copying the bytes a second time
+    spool_name = getattr(file.stream, 'name', None)
+    if isinstance(spool_name, str) and os.path.dirname(spool_name) == os.path.dirname(filepath):
+        try:
+            file.stream.flush()
+            os.link(spool_name, tmp_path)
+            os.replace(tmp_path, filepath)
+            return filepath
+        except OSError:
+            file.stream.seek(0)
+
+    fd = None
+    if _UPLOAD_DIR_FD is not None:
+        try:
+            fd = os.open('.', os.O_TMPFILE | os.O_RDWR, 0o644, dir_fd=_UPLOAD_DIR_FD)
+        except OSError:
+            fd = None  # filesystem without O_TMPFILE support
+
+    if fd is not None:
+        try:
+            _copy_stream(file, fd)
+            try:
+                os.link(f"/proc/self/fd/{fd}", tmp_path)
+            except OSError:
+                # linkat via /proc refused (e.g. sandboxed kernels): copy the finished inode out
+                with open(fd, 'rb', closefd=False) as src, open(tmp_path, 'wb') as dst:
+                    src.seek(0)
+                    shutil.copyfileobj(src, dst, length=UPLOAD_CHUNK_SIZE)
+        finally:
+            os.close(fd)
+    else:
+        fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            _copy_stream(file, fd)
+        except BaseException:
+            os.close(fd)
+            os.unlink(tmp_path)
+            raise
+        os.close(fd)
+
+    # Atomic rename, so a same-named upload in flight is replaced rather than interleaved
+    os.replace(tmp_path, filepath)
+    return filepath
+
+# Long-running work (uploads, RAG answers, subject notes) can run as a background job:
+# the route answers 202 with a job id and the client polls GET /jobs/<id>.
+JOB_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("JOB_WORKERS", "4")))
+
+def _wants_async() -> bool:
+    return request.args.get("async") == "1" or "respond-async" in request.headers.get("Prefer", "")
+
+def _submit_job(user_id: str, fn, *args):
+    """Run fn(*args) -> (payload, status) on JOB_POOL and return the job id.
+
+    Job state lives in the Mongo ``jobs`` collection so a poll can land on any gunicorn
+    worker; returns None when the database is unavailable and the job can't be tracked.
+    """
+    db = orchestrator.db_service
+    job_id = uuid.uuid4().hex
+    if not db.create_job(job_id, user_id):
+        return None
+
+    def run():
+        db.update_job(job_id, status="started")
+        try:
+            payload, status = fn(*args)
+            # Stored as JSON bytes: payloads may hold values BSON can't encode (numpy scores, sets)
+            db.update_job(job_id, status="finished", result=_dumps(payload), http_status=status,
+                          finished_at=datetime.utcnow())
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            db.update_job(job_id, status="failed", error=str(e), http_status=500, finished_at=datetime.utcnow())
+
+    JOB_POOL.submit(run)
+    return job_id
+
+def _job_accepted(job_id):
+    if job_id is None:
+        return ojsonify({"error": "Background jobs need the database; retry without async"}, 503)
+    resp = ojsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}, 202)
+    resp.headers["Location"] = f"/jobs/{job_id}"
+    return resp
+
+# Argon2id for new hashes; anything else is a legacy Werkzeug hash ("pbkdf2:..." or
+# "scrypt:...") that is still accepted and upgraded on the next successful login.
+PH = PasswordHasher(
+    time_cost=Config.PW_TIME_COST,
+    memory_cost=Config.PW_MEMORY_COST,
+    parallelism=Config.PW_PARALLELISM
+)
+ARGON2_HASH_PREFIX = "$argon2"
+
+# Password hashing gets its own small pool so a burst of logins can't starve upload
+# I/O; argon2-cffi and hashlib's pbkdf2 both release the GIL, so threads are enough
+HASH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("HASH_WORKERS", "2")))
+
+def _hash_password(password: str) -> str:
+    return HASH_POOL.submit(PH.hash, password).result()
+
+def _verify_password(password_hash: str, password: str):
+    """Returns (is_valid, needs_rehash)."""
+    if not password_hash:
+        return False, False
+    if not password_hash.startswith(ARGON2_HASH_PREFIX):
+        try:
+            ok = HASH_POOL.submit(check_password_hash, password_hash, password).result()
+        except ValueError:
+            # Unknown Werkzeug method string
+            return False, False
+        return ok, ok
+    try:
+        HASH_POOL.submit(PH.verify, password_hash, password).result()
+    except (VerifyMismatchError, VerificationError, InvalidHashError):
+        return False, False
+    return True, PH.check_needs_rehash(password_hash)
+
+# HS256 JWTs signed directly with hmac/hashlib; the header never changes, so encode it once
+_JWT_SECRET = Config.JWT_SECRET_KEY.encode()
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(orjson.dumps({"alg": "HS256", "typ": "JWT"})).rstrip(b"=")
+
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+def _jwt_encode(payload: dict) -> str:
+    signing_input = _JWT_HEADER_B64 + b"." + base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=")
+    signature = hmac.new(_JWT_SECRET, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + base64.urlsafe_b64encode(signature).rstrip(b"=")).decode()
+
+def _jwt_decode(token: str):
+    """Return the payload of a valid, unexpired HS256 token, or None."""
+    try:
+        raw = token.encode()
+        signing_input, _, signature = raw.rpartition(b".")
+        header_b64, _, payload_b64 = signing_input.partition(b".")
+        if not header_b64 or not payload_b64:
+            return None
+        expected = hmac.new(_JWT_SECRET, signing_input, hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            return None
+        if orjson.loads(_b64url_decode(header_b64)).get("alg") != "HS256":
+            return None
+        payload = orjson.loads(_b64url_decode(payload_b64))
+        exp = payload.get("exp")
+        if exp is not None and float(exp) <= time.time():
+            return None
+        return payload
+    except (ValueError, TypeError, AttributeError):
+        return None
+
 def _create_token(user: dict) -> str:
     payload = {
         "sub": str(user.get("_id")),
         "email": user.get("email"),
         "role": user.get("role", "user"),
-        "exp": datetime.utcnow() + timedelta(minutes=Config.JWT_EXPIRES_MIN)
+        "exp": int(time.time()) + _JWT_EXPIRES_SECONDS
     }
-    return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm="HS256")
+    return _jwt_encode(payload)
 
 def _get_bearer_token():
-    auth_header = request.headers.get("Authorization", "")
-    if not auth_header.startswith("Bearer "):
+    scheme, sep, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme != "Bearer" or not sep:
         return None
-    return auth_header.split(" ", 1)[1].strip()
+    return token.strip() or None
+
+# Verified token -> (user, expires_at) so repeat requests skip the HS256 check and user lookup
+_TOKEN_CACHE = OrderedDict()
+_TOKEN_CACHE_LOCK = threading.Lock()
+_TOKEN_CACHE_MAX = 10000
+_TOKEN_CACHE_TTL = Config.AUTH_CACHE_TTL
+
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def _cached_user_for_token(token: str):
+    key = _token_cache_key(token)
+    with _TOKEN_CACHE_LOCK:
+        entry = _TOKEN_CACHE.get(key)
+        if not entry:
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            del _TOKEN_CACHE[key]
+            return None
+        _TOKEN_CACHE.move_to_end(key)
+        return dict(user)
+
+def _cache_user_for_token(token: str, user: dict, token_exp):
+    expires_at = time.time() + _TOKEN_CACHE_TTL
+    if token_exp:
+        expires_at = min(expires_at, float(token_exp))
+    key = _token_cache_key(token)
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE[key] = (dict(user), expires_at)
+        _TOKEN_CACHE.move_to_end(key)
+        while len(_TOKEN_CACHE) > _TOKEN_CACHE_MAX:
+            _TOKEN_CACHE.popitem(last=False)
+
+def forget_token(token: str):
+    """Drop a token from the auth cache (e.g. on logout)."""
+    with _TOKEN_CACHE_LOCK:
+        _TOKEN_CACHE.pop(_token_cache_key(token), None)
+
+def _conditional_json(payload, max_age: int = 30):
+    """ojsonify with a content ETag; answers 304 when the client already has this body."""
+    body = _dumps(payload)
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        resp = app.response_class(status=304)
+    else:
+        # The orjson bytes go to the response as-is, without a second encode or copy
+        resp = app.response_class(body, status=200, mimetype='application/json')
+    resp.headers['Cache-Control'] = f'private, max-age={max_age}'
+    resp.set_etag(etag, weak=True)
+    return resp
+
+# (user_id, is_admin, scope) -> (subjects, expires_at); cleared whenever notes are added or removed
+_SUBJECTS_CACHE = OrderedDict()
+_SUBJECTS_CACHE_LOCK = threading.Lock()
+_SUBJECTS_CACHE_TTL = 60
+_SUBJECTS_CACHE_MAX = 1024
+
+def _subjects_cache_key(user_id: str, is_admin: bool, scope: str = None):
+    # The shared list and the admin (unscoped) list are the same for every caller, so share one entry
+    if scope == "shared":
+        return (None, False, "shared")
+    if is_admin and not scope:
+        return (None, True, None)
+    return (user_id, is_admin, scope)
+
+def _get_subjects_cached(user_id: str, is_admin: bool, scope: str = None):
+    key = _subjects_cache_key(user_id, is_admin, scope)
+    now = time.time()
+    with _SUBJECTS_CACHE_LOCK:
+        entry = _SUBJECTS_CACHE.get(key)
+        if entry and entry[1] > now:
+            _SUBJECTS_CACHE.move_to_end(key)
+            return list(entry[0])
+    subjects = orchestrator.db_service.get_all_subjects(user_id, is_admin, scope)
+    with _SUBJECTS_CACHE_LOCK:
+        _SUBJECTS_CACHE[key] = (list(subjects), now + _SUBJECTS_CACHE_TTL)
+        _SUBJECTS_CACHE.move_to_end(key)
+        while len(_SUBJECTS_CACHE) > _SUBJECTS_CACHE_MAX:
+            _SUBJECTS_CACHE.popitem(last=False)
+    return subjects
+
+def _invalidate_subjects():
+    with _SUBJECTS_CACHE_LOCK:
+        _SUBJECTS_CACHE.clear()
 
 def _get_current_user():
     token = _get_bearer_token()
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        if not user_id:
-            return None
-        user = orchestrator.db_service.get_user_by_id(user_id)
-        if not user:
-            return None
-
-        token_role = payload.get("role")
-        if token_role and user.get("role") != token_role:
-            user["role"] = token_role
-
-        admin_email = (Config.ADMIN_EMAIL or "").strip().lower()
-        if admin_email and user.get("email", "").lower() == admin_email:
-            user["role"] = "admin"
-        return user
-    except jwt.ExpiredSignatureError:
+    cached = _cached_user_for_token(token)
+    if cached:
+        return cached
+    payload = _jwt_decode(token)
+    if not payload:
         return None
-    except jwt.InvalidTokenError:
+    user_id = payload.get("sub")
+    if not user_id:
+        return None
+    user = orchestrator.db_service.get_user_by_id(user_id)
+    if not user:
         return None
 
-def _dedupe_paragraphs(text: str) -> str:
+    token_role = payload.get("role")
+    if token_role and user.get("role") != token_role:
+        user["role"] = token_role
+
+    # create_user stores emails lowercased, so no per-request .lower() is needed
+    if _ADMIN_EMAIL_LC and user.get("email") == _ADMIN_EMAIL_LC:
+        user["role"] = "admin"
+    _cache_user_for_token(token, user, payload.get("exp"))
+    return user
+
+# google-re2 matches in linear time without backtracking, which matters on
+# multi-megabyte combined outputs; the patterns are plain enough for either engine
+try:
+    import re2 as _re_fast
+except ImportError:
+    _re_fast = re
+
+_PARA_SPLIT = _re_fast.compile(r"\n\s*\n")
+_NON_ALNUM = _re_fast.compile(r"[^a-z0-9\s]")
+_WS = _re_fast.compile(r"\s+")
+
+def _dedupe_paragraphs_py(text: str) -> str:
     if not text:
         return text
-    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    paragraphs = [p.strip() for p in _PARA_SPLIT.split(text) if p.strip()]
+    # Only hashes are kept, not the (possibly long) normalized paragraphs
     seen = set()
     kept = []
     for paragraph in paragraphs:
-        normalized = re.sub(r"[^a-z0-9\s]", " ", paragraph.lower())
-        normalized = re.sub(r"\s+", " ", normalized).strip()
-        if not normalized or normalized in seen:
+        normalized = _NON_ALNUM.sub(" ", paragraph.lower())
+        normalized = _WS.sub(" ", normalized).strip()
+        if not normalized:
             continue
-        seen.add(normalized)
+        key = hash(normalized)
+        if key in seen:
+            continue
+        seen.add(key)
         kept.append(paragraph)
     return "\n\n".join(kept)
 
+# Compiled version of the same dedupe (server/_dedupe.pyx) when it has been built
+try:
+    from _dedupe import dedupe_paragraphs as _dedupe_paragraphs
+except ImportError:
+    _dedupe_paragraphs = _dedupe_paragraphs_py
+
 def require_auth(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
         user = _get_current_user()
         if not user:
-            return jsonify({"error": "Unauthorized"}), 401
+            return ojsonify({"error": "Unauthorized"}, 401)
         request.user = user
         return fn(*args, **kwargs)
     return wrapper
 
+_HEALTH_BYTES = b'{"status":"healthy","service":"Autonotex Backend"}'
+_HEALTH_HEADERS = [("Content-Type", "application/json"), ("Content-Length", str(len(_HEALTH_BYTES)))]
+
+class _HealthCheckMiddleware:
+    """Answers GET /health before Flask routing, CORS, compression or rate limiting run."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == "/health" and environ.get("REQUEST_METHOD") in ("GET", "HEAD"):
+            start_response("200 OK", list(_HEALTH_HEADERS))
+            return [_HEALTH_BYTES]
+        return self.wsgi_app(environ, start_response)
+
+class _HealthLogFilter(logging.Filter):
+    # Load balancer probes would otherwise dominate the access log
+    def filter(self, record):
+        return "/health" not in record.getMessage()
+
+app.wsgi_app = _HealthCheckMiddleware(app.wsgi_app)
+for _name in ("werkzeug", "gunicorn.access"):
+    logging.getLogger(_name).addFilter(_HealthLogFilter())
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "service": "Autonotex Backend"}), 200
+    return app.response_class(_HEALTH_BYTES, mimetype='application/json')
 
 @app.route('/auth/register', methods=['POST'])
+@limiter.limit(Config.AUTH_RATE_LIMIT)
 def register_user():
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
 
     if not email or not password:
-        return jsonify({"error": "Email and password are required"}), 400
+        return ojsonify({"error": "Email and password are required"}, 400)
 
-    if Config.ADMIN_EMAIL and email == Config.ADMIN_EMAIL.lower():
-        return jsonify({"error": "Admin account is restricted"}), 403
+    if _ADMIN_EMAIL_LC and email == _ADMIN_EMAIL_LC:
+        return ojsonify({"error": "Admin account is restricted"}, 403)
 
     if orchestrator.db_service.get_user_by_email(email):
-        return jsonify({"error": "User already exists"}), 409
+        return ojsonify({"error": "User already exists"}, 409)
 
-    password_hash = generate_password_hash(password)
+    password_hash = _hash_password(password)
     user = orchestrator.db_service.create_user(email, password_hash)
     if not user:
-        return jsonify({"error": "Failed to create user"}), 500
+        return ojsonify({"error": "Failed to create user"}, 500)
 
     token = _create_token(user)
-    return jsonify({
+    return ojsonify({
         "token": token,
         "user": {
             "id": user.get("_id"),
             "email": user.get("email"),
             "role": user.get("role", "user")
         }
-    }), 201
+    }, 201)
+
+# (admin user document, expires_at), loaded (or created) on admin login and re-read after
+# AUTH_CACHE_TTL so role changes or a deleted account are picked up
+_ADMIN_USER = None
+_ADMIN_USER_LOCK = threading.Lock()
+_ADMIN_USER_TTL = Config.AUTH_CACHE_TTL
+
+def _get_admin_user(email: str, password: str):
+    global _ADMIN_USER
+    with _ADMIN_USER_LOCK:
+        if _ADMIN_USER is not None and _ADMIN_USER[1] > time.time():
+            return dict(_ADMIN_USER[0])
+        _ADMIN_USER = None
+
+        user = orchestrator.db_service.get_user_by_email(email)
+        if not user:
+            # Only hash on the very first admin login, when the account is created
+            user = orchestrator.db_service.create_user(email, _hash_password(password), role="admin")
+        elif orchestrator.db_service.db is None:
+            return None
+        elif user.get("role") != "admin":
+            # Promote once; an account that is already admin needs no write
+            orchestrator.db_service.set_user_role(str(user.get("_id")), "admin")
+            user["role"] = "admin"
+
+        if user:
+            _ADMIN_USER = (dict(user), time.time() + _ADMIN_USER_TTL)
+        return user
 
 @app.route('/auth/login', methods=['POST'])
+@limiter.limit(Config.AUTH_RATE_LIMIT)
 def login_user():
-    data = request.json or {}
+    data = request.get_json(silent=True) or {}
     email = (data.get("email") or "").strip().lower()
     password = data.get("password") or ""
 
     if not email or not password:
-        return jsonify({"error": "Email and password are required"}), 400
+        return ojsonify({"error": "Email and password are required"}, 400)
 
-    if Config.ADMIN_EMAIL and Config.ADMIN_PASSWORD:
-        if email == Config.ADMIN_EMAIL.lower() and password == Config.ADMIN_PASSWORD:
-            user = orchestrator.db_service.get_user_by_email(email)
+    if _ADMIN_EMAIL_LC and _ADMIN_PASSWORD:
+        # Constant-time compare so response timing doesn't leak the admin password
+        if email == _ADMIN_EMAIL_LC and hmac.compare_digest(password.encode(), _ADMIN_PASSWORD):
+            user = _get_admin_user(email, password)
             if not user:
-                user = orchestrator.db_service.create_user(email, generate_password_hash(password), role="admin")
-            elif orchestrator.db_service.db is not None:
-                orchestrator.db_service.db.users.update_one(
-                    {"_id": user.get("_id")},
-                    {"$set": {"role": "admin"}}
-                )
-                user["role"] = "admin"
-            else:
-                return jsonify({"error": "Database unavailable"}), 503
+                return ojsonify({"error": "Database unavailable"}, 503)
 
             token = _create_token(user)
-            return jsonify({
+            return ojsonify({
                 "token": token,
                 "user": {
                     "id": str(user.get("_id")),
                     "email": user.get("email"),
                     "role": user.get("role", "admin")
                 }
-            }), 200
+            }, 200)
 
     user = orchestrator.db_service.get_user_by_email(email)
-    if not user or not check_password_hash(user.get("password_hash", ""), password):
-        return jsonify({"error": "Invalid credentials"}), 401
+    if not user:
+        return ojsonify({"error": "Invalid credentials"}, 401)
+    is_valid, needs_rehash = _verify_password(user.get("password_hash", ""), password)
+    if not is_valid:
+        return ojsonify({"error": "Invalid credentials"}, 401)
+    if needs_rehash:
+        orchestrator.db_service.update_user_password_hash(str(user.get("_id")), _hash_password(password))
 
     token = _create_token(user)
-    return jsonify({
+    return ojsonify({
         "token": token,
         "user": {
             "id": str(user.get("_id")),
             "email": user.get("email"),
             "role": user.get("role", "user")
         }
-    }), 200
+    }, 200)
+
+@app.route('/auth/logout', methods=['POST'])
+@require_auth
+def logout_user():
+    """Drop the token's cached user; the client discards the token, which is still valid until it expires."""
+    forget_token(_get_bearer_token())
+    return ojsonify({"message": "Logged out"}, 200)
 
 @app.route('/auth/me', methods=['GET'])
 @require_auth
 def get_current_user_profile():
     user = request.user
-    return jsonify({
+    return ojsonify({
         "user": {
             "id": str(user.get("_id")),
             "email": user.get("email"),
             "role": user.get("role", "user")
         }
-    }), 200
+    }, 200)
 
 @app.route('/upload', methods=['POST'])
 @require_auth
@@ -190,38 +635,46 @@ def upload_file():
         if 'file' in request.files: # Fallback for single file
             files = [request.files['file']]
         else:
-            return jsonify({"error": "No file part"}), 400
+            return ojsonify({"error": "No file part"}, 400)
     else:
         files = request.files.getlist('files')
 
     if not files or files[0].filename == '':
-        return jsonify({"error": "No selected file"}), 400
+        return ojsonify({"error": "No selected file"}, 400)
 
-    uploaded_paths = []
-    file_types = []
+    files = [file for file in files if file]
+    filepaths = [_upload_path(file.filename) for file in files]
+    uploaded_paths = list(IO_POOL.map(_save_upload, files, filepaths))
+    file_types = [file.content_type for file in files]
 
-    for file in files:
-        if file:
-            filepath = os.path.join(Config.UPLOAD_FOLDER, file.filename)
-            file.save(filepath)
-            uploaded_paths.append(filepath)
-            file_types.append(file.content_type)
-        
     user = request.user
     scope = "shared" if user.get("role") == "admin" else "private"
 
+    if _wants_async():
+        job_id = _submit_job(str(user.get("_id")), _process_upload, uploaded_paths, file_types, str(user.get("_id")), scope)
+        return _job_accepted(job_id)
+
     # Process with Agents
     try:
-        # We pass the list to orchestrator to merge
-        result = orchestrator.handle_multiple_uploads(uploaded_paths, file_types, str(user.get("_id")), scope)
-        print(f"Upload successful. Result keys: {result.keys()}")
-        print(f"Graph nodes count: {len(result.get('graph', {}).get('nodes', []))}")
-        return jsonify(result), 200
+        payload, status = _process_upload(uploaded_paths, file_types, str(user.get("_id")), scope)
+        return ojsonify(payload, status)
     except Exception as e:
-        import traceback
-        print("Upload Error:")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("upload_file failed")
+        return ojsonify({"error": str(e)}, 500)
+
+def _on_upload_indexed(doc_id, ok):
+    # New content can change any cached RAG answer; clearing only once the vectors are
+    # searchable means answers cached in between can't outlive the upload
+    semantic_cache.clear()
+    if not ok:
+        logger.error("Upload %s: vector indexing failed; the note is saved but not searchable", doc_id)
+
+def _process_upload(uploaded_paths, file_types, user_id, scope):
+    # We pass the list to orchestrator to merge
+    result = orchestrator.handle_multiple_uploads(uploaded_paths, file_types, user_id, scope, _on_upload_indexed)
+    _invalidate_subjects()
+    logger.info("Upload %s processed: %d graph nodes", result.get("doc_id"), len(result.get("graph", {}).get("nodes", [])))
+    return result, 200
 
 @app.route('/search', methods=['POST'])
 @require_auth
@@ -231,20 +684,28 @@ def search_knowledge_base():
     Request body: {"query": "search term"}
     """
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         query = data.get('query', '')
         
         if not query:
-            return jsonify({"error": "Query is required"}), 400
+            return ojsonify({"error": "Query is required"}, 400)
         
         user = request.user
         is_admin = user.get("role") == "admin"
-        results = orchestrator.search_knowledge_base(query, str(user.get("_id")), None, is_admin)
-        return jsonify(results), 200
+        user_id = str(user.get("_id"))
+        cached = semantic_cache.get(query, user_id, "search")
+        if cached is not None:
+            return ojsonify(cached, 200)
+
+        results = orchestrator.search_knowledge_base(query, user_id, None, is_admin)
+        semantic_cache.put(
+            query, user_id, "search", results,
+            _source_doc_ids(results.get("note_results"), results.get("concept_results"))
+        )
+        return ojsonify(results, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("search_knowledge_base failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/concept/<concept_name>', methods=['GET'])
 @require_auth
@@ -256,36 +717,97 @@ def get_concept_details(concept_name):
         doc_id = request.args.get('doc_id', None)
         user = request.user
         is_admin = user.get("role") == "admin"
-        details = orchestrator.get_concept_details(concept_name, str(user.get("_id")), doc_id, is_admin)
-        return jsonify(details), 200
+        user_id = str(user.get("_id"))
+        cache_scope = f"concept:{doc_id or ''}"
+        cached = semantic_cache.get(concept_name, user_id, cache_scope)
+        if cached is not None:
+            return ojsonify(cached, 200)
+
+        details = orchestrator.get_concept_details(concept_name, user_id, doc_id, is_admin)
+        if "error" not in (details.get("explanation") or {}):
+            semantic_cache.put(concept_name, user_id, cache_scope, details, _source_doc_ids(details.get("related_content")))
+        return ojsonify(details, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_concept_details failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/question', methods=['POST'])
 @require_auth
 def answer_question():
     """
     Answer a user question using RAG.
-    Request body: {"question": "your question", "doc_id": "optional"}
+    Request body: {"question": "your question", "doc_id": "optional", "session_id": "optional"}
     """
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         question = data.get('question', '')
         doc_id = data.get('doc_id', None)
+        session_id = _question_session_id(data)
         
         if not question:
-            return jsonify({"error": "Question is required"}), 400
+            return ojsonify({"error": "Question is required"}, 400)
         
         user = request.user
         is_admin = user.get("role") == "admin"
-        answer_data = orchestrator.answer_user_question(question, str(user.get("_id")), doc_id, is_admin)
-        return jsonify(answer_data), 200
+        user_id = str(user.get("_id"))
+        cache_scope = f"question:{doc_id or ''}"
+        cached = semantic_cache.get(question, user_id, cache_scope)
+        if cached is not None:
+            return ojsonify(cached, 200)
+
+        if _wants_async():
+            return _job_accepted(_submit_job(user_id, _answer_question, question, user_id, doc_id, is_admin, cache_scope, session_id))
+
+        payload, status = _answer_question(question, user_id, doc_id, is_admin, cache_scope, session_id)
+        return ojsonify(payload, status)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("answer_question failed")
+        return ojsonify({"error": str(e)}, 500)
+
+def _question_session_id(data: dict):
+    """Conversation id for follow-up context reuse; only set when the client sends one."""
+    session_id = data.get('session_id') or request.headers.get('X-Session-Id')
+    return str(session_id) if session_id else None
+
+def _answer_question(question, user_id, doc_id, is_admin, cache_scope, session_id=None):
+    answer_data = orchestrator.answer_user_question(question, user_id, doc_id, is_admin, session_id)
+    if not str(answer_data.get("answer", "")).startswith("Unable to generate answer"):
+        semantic_cache.put(question, user_id, cache_scope, answer_data, _source_doc_ids(answer_data.get("sources")))
+    return answer_data, 200
+
+@app.route('/question/stream', methods=['POST'])
+@require_auth
+def stream_question():
+    """
+    Answer a user question using RAG, streamed as Server-Sent Events.
+    Request body: {"question": "your question", "doc_id": "optional", "session_id": "optional"}
+    Emits "delta" events with answer text, then a final "done" event with sources.
+    """
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '')
+    doc_id = data.get('doc_id', None)
+    session_id = _question_session_id(data)
+
+    if not question:
+        return ojsonify({"error": "Question is required"}, 400)
+
+    user = request.user
+    is_admin = user.get("role") == "admin"
+    user_id = str(user.get("_id"))
+
+    def generate():
+        try:
+            for event, payload in orchestrator.stream_user_question(question, user_id, doc_id, is_admin, session_id):
+                yield _sse_event(event, payload)
+        except Exception as e:
+            logger.exception("stream_question failed")
+            yield _sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/notes/<doc_id>', methods=['GET'])
 @require_auth
@@ -298,15 +820,13 @@ def get_note(doc_id):
         is_admin = user.get("role") == "admin"
         note = orchestrator.db_service.get_note_by_id(doc_id, str(user.get("_id")), is_admin)
         if not note:
-            return jsonify({"error": "Note not found"}), 404
-        
-        # Convert MongoDB ObjectId to string for JSON serialization
-        note['_id'] = str(note['_id'])
-        return jsonify(note), 200
+            return ojsonify({"error": "Note not found"}, 404)
+
+        # ObjectId is stringified by the orjson default hook
+        return _conditional_json(note)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_note failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/notes/<doc_id>', methods=['DELETE'])
 @require_auth
@@ -316,46 +836,55 @@ def delete_note(doc_id):
         is_admin = user.get("role") == "admin"
         deleted = orchestrator.db_service.delete_note(doc_id, str(user.get("_id")), is_admin)
         if not deleted:
-            return jsonify({"error": "Not found or not allowed"}), 404
+            return ojsonify({"error": "Not found or not allowed"}, 404)
 
         if orchestrator.vector_db:
             orchestrator.vector_db.delete_document(doc_id)
-        return jsonify({"status": "deleted", "doc_id": doc_id}), 200
+        semantic_cache.evict_doc(doc_id)
+        _invalidate_subjects()
+        return ojsonify({"status": "deleted", "doc_id": doc_id}, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("delete_note failed")
+        return ojsonify({"error": str(e)}, 500)
+
+# The library list only shows metadata; leave the large fields in Mongo
+NOTE_LIST_PROJECTION = {
+    "doc_id": 1, "subject": 1, "scope": 1, "user_id": 1,
+    "content_summary": 1, "created_at": 1, "updated_at": 1
+}
+# /notes/combined only stitches notes_text (or the legacy notes field) together
+COMBINED_NOTES_PROJECTION = {"doc_id": 1, "subject": 1, "notes_text": 1, "notes": 1}
+MAX_NOTE_IDS = 100
 
 @app.route('/notes', methods=['GET'])
 @require_auth
 def get_all_notes():
     """
-    Retrieve all notes (limited) or by subject.
-    Query params: limit=10, subject=DBMS
+    Retrieve all notes (limited), by subject, or a batch of specific notes.
+    Query params: limit=10, subject=DBMS, ids=doc1,doc2,doc3
     """
     try:
         limit = request.args.get('limit', 10, type=int)
         subject = request.args.get('subject', None)
+        ids = request.args.get('ids', '')
         
         user = request.user
         is_admin = user.get("role") == "admin"
-        if subject:
+        if ids:
+            # Several full notes in one round trip instead of one /notes/<doc_id> call each
+            doc_ids = [doc_id.strip() for doc_id in ids.split(',') if doc_id.strip()][:MAX_NOTE_IDS]
+            notes = orchestrator.db_service.get_notes_by_ids(doc_ids, str(user.get("_id")), is_admin)
+        elif subject:
             # Get notes for specific subject
-            notes = orchestrator.db_service.search_notes_by_subject(subject, str(user.get("_id")), is_admin)
-            print(f"Retrieved {len(notes)} notes for subject: {subject}")
+            notes = orchestrator.db_service.search_notes_by_subject(subject, str(user.get("_id")), is_admin, None, NOTE_LIST_PROJECTION)
         else:
             # Get all notes
-            notes = orchestrator.db_service.get_all_notes(limit, str(user.get("_id")), is_admin)
-        
-        # Convert MongoDB ObjectIds to strings for JSON serialization
-        for note in notes:
-            note['_id'] = str(note['_id'])
-        
-        return jsonify({"notes": notes, "count": len(notes), "subject": subject}), 200
+            notes = orchestrator.db_service.get_all_notes(limit, str(user.get("_id")), is_admin, NOTE_LIST_PROJECTION)
+
+        return _conditional_json({"notes": notes, "count": len(notes), "subject": subject})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_all_notes failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/notes/combined', methods=['GET'])
 @require_auth
@@ -366,38 +895,32 @@ def get_combined_notes():
 
         user = request.user
         is_admin = user.get("role") == "admin"
-        notes = orchestrator.db_service.get_all_notes(limit, str(user.get("_id")), is_admin)
-
-        if scope in {"shared", "private"}:
-            notes = [n for n in notes if n.get("scope") == scope and (scope == "shared" or n.get("user_id") == str(user.get("_id")))]
-
-        notes_sorted = sorted(
-            notes,
-            key=lambda n: n.get("updated_at") or n.get("created_at") or 0,
-            reverse=True
+        # Scope filter, newest-first sort and limit all run in Mongo
+        notes = orchestrator.db_service.get_recently_updated_notes(
+            limit, str(user.get("_id")), is_admin, scope, COMBINED_NOTES_PROJECTION
         )
 
-        sections = []
-        for note in notes_sorted:
-            title = note.get("subject") or "Untitled"
-            doc_id = note.get("doc_id") or "unknown"
-            notes_text = note.get("notes_text") or note.get("notes") or ""
-            if not notes_text:
-                continue
-            sections.append(f"## Document: {title} ({doc_id})\n\n{notes_text}")
+        count = 0
+
+        def sections():
+            nonlocal count
+            for note in notes:
+                notes_text = note.get("notes_text") or note.get("notes") or ""
+                if not notes_text:
+                    continue
+                count += 1
+                yield f"## Document: {note.get('subject') or 'Untitled'} ({note.get('doc_id') or 'unknown'})\n\n{notes_text}"
 
-        combined = "\n\n---\n\n".join(sections)
-        combined = _dedupe_paragraphs(combined)
+        combined = _dedupe_paragraphs("\n\n---\n\n".join(sections()))
 
-        return jsonify({
+        return ojsonify({
             "notes": combined,
-            "count": len(sections),
+            "count": count,
             "scope": scope
-        }), 200
+        }, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_combined_notes failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/generate/notes/subject', methods=['POST'])
 @require_auth
@@ -407,24 +930,47 @@ def generate_notes_for_subject():
     Request body: {"subject": "DBMS"}
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         subject = data.get('subject', '').strip()
         scope = (data.get('scope') or '').strip().lower() or None
 
         if not subject:
-            return jsonify({"error": "Subject is required"}), 400
+            return ojsonify({"error": "Subject is required"}, 400)
 
         user = request.user
         is_admin = user.get("role") == "admin"
-        result = orchestrator.generate_notes_for_subject(subject, str(user.get("_id")), is_admin, scope)
-        if not result:
-            return jsonify({"error": "No notes found for this subject"}), 404
+        if _wants_async():
+            return _job_accepted(_submit_job(str(user.get("_id")), _generate_subject_notes, subject, str(user.get("_id")), is_admin, scope))
 
-        return jsonify(result), 200
+        payload, status = _generate_subject_notes(subject, str(user.get("_id")), is_admin, scope)
+        return ojsonify(payload, status)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("generate_notes_for_subject failed")
+        return ojsonify({"error": str(e)}, 500)
+
+def _generate_subject_notes(subject, user_id, is_admin, scope):
+    result = orchestrator.generate_notes_for_subject(subject, user_id, is_admin, scope)
+    if not result:
+        return {"error": "No notes found for this subject"}, 404
+    return result, 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@require_auth
+def get_job(job_id):
+    """
+    Poll a background job started with ?async=1.
+    """
+    job = orchestrator.db_service.get_job(job_id, str(request.user.get("_id")))
+    if not job:
+        return ojsonify({"error": "Job not found"}, 404)
+    result = job.get("result")
+    return ojsonify({
+        "job_id": job_id,
+        "status": job.get("status"),
+        "http_status": job.get("http_status"),
+        "result": orjson.loads(result) if result else None,
+        "error": job.get("error")
+    }, 200)
 
 @app.route('/subjects', methods=['GET'])
 @require_auth
@@ -436,13 +982,11 @@ def get_all_subjects():
         user = request.user
         is_admin = user.get("role") == "admin"
         scope = (request.args.get('scope') or '').strip().lower() or None
-        subjects = orchestrator.db_service.get_all_subjects(str(user.get("_id")), is_admin, scope)
-        print(f"API /subjects endpoint returning: {subjects}")
-        return jsonify({"subjects": subjects, "count": len(subjects)}), 200
+        subjects = _get_subjects_cached(str(user.get("_id")), is_admin, scope)
+        return _conditional_json({"subjects": subjects, "count": len(subjects)})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_all_subjects failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/quiz/questions/<subject>', methods=['GET'])
 @require_auth
@@ -457,34 +1001,64 @@ def get_quiz_questions(subject):
         count = request.args.get('count', 15, type=int)
         questions = orchestrator.get_quiz_questions(subject, str(user.get("_id")), is_admin, count, scope)
         if not questions:
-            return jsonify({"error": "No quiz questions found for this subject"}), 404
-        return jsonify({"questions": questions, "count": len(questions)}), 200
+            return ojsonify({"error": "No quiz questions found for this subject"}, 404)
+        return _conditional_json({"questions": questions, "count": len(questions)})
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("get_quiz_questions failed")
+        return ojsonify({"error": str(e)}, 500)
 
 @app.route('/web-search', methods=['POST'])
 @require_auth
 def web_search_concept():
     """
     Search the web for a concept and return summarised study notes.
-    Request body: {"concept": "Superkey in DBMS", "context": "optional subject hint"}
+    Request body: {"concept": "Superkey in DBMS", "context": "optional subject hint", "include_images": false}
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         concept = (data.get('concept') or '').strip()
         context = (data.get('context') or '').strip()
 
         if not concept:
-            return jsonify({"error": "concept is required"}), 400
+            return ojsonify({"error": "concept is required"}, 400)
 
-        result = web_search.search_and_summarise(concept, context_hint=context)
-        return jsonify(result), 200
+        result = web_search.search_and_summarise(
+            concept, context_hint=context, include_images=bool(data.get('include_images'))
+        )
+        return ojsonify(result, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("web_search_concept failed")
+        return ojsonify({"error": str(e)}, 500)
+
+
+@app.route('/web-search/stream', methods=['POST'])
+@require_auth
+def stream_web_search_concept():
+    """
+    Search the web for a concept and stream the summary as Server-Sent Events.
+    Request body: {"concept": "Superkey in DBMS", "context": "optional subject hint"}
+    Emits a "results" event with the hits, "delta" events with summary text, then "done".
+    """
+    data = request.get_json(silent=True) or {}
+    concept = (data.get('concept') or '').strip()
+    context = (data.get('context') or '').strip()
+
+    if not concept:
+        return ojsonify({"error": "concept is required"}, 400)
+
+    def generate():
+        try:
+            for event, payload in web_search.stream_search_and_summarise(concept, context_hint=context):
+                yield _sse_event(event, payload)
+        except Exception as e:
+            logger.exception("stream_web_search_concept failed")
+            yield _sse_event("error", {"error": str(e)})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.route('/image-search', methods=['POST'])
@@ -495,19 +1069,18 @@ def image_search_concept():
     Request body: {"query": "Von Neumann Architecture", "max_results": 12}
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         query = (data.get('query') or '').strip()
         max_results = int(data.get('max_results', 12))
 
         if not query:
-            return jsonify({"error": "query is required"}), 400
+            return ojsonify({"error": "query is required"}, 400)
 
         images = web_search.search_images(query, max_results=min(max_results, 20))
-        return jsonify({"query": query, "images": images}), 200
+        return ojsonify({"query": query, "images": images}, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("image_search_concept failed")
+        return ojsonify({"error": str(e)}, 500)
 
 
 @app.route('/notes/<doc_id>/append', methods=['POST'])
@@ -518,29 +1091,20 @@ def append_to_note(doc_id):
     Request body: {"content": "markdown text to append"}
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         extra = (data.get('content') or '').strip()
         if not extra:
-            return jsonify({"error": "content is required"}), 400
+            return ojsonify({"error": "content is required"}, 400)
 
         user = request.user
         is_admin = user.get("role") == "admin"
-        note = orchestrator.db_service.get_note_by_id(doc_id, str(user.get("_id")), is_admin)
-        if not note:
-            return jsonify({"error": "Note not found"}), 404
-
-        existing = note.get("notes_text") or note.get("notes") or ""
-        updated = existing + "\n\n---\n\n" + extra
-
-        orchestrator.db_service.db.notes.update_one(
-            {"doc_id": doc_id},
-            {"$set": {"notes_text": updated, "notes": updated}}
-        )
-        return jsonify({"status": "appended", "doc_id": doc_id}), 200
+        # Single pipeline update, so concurrent appends can't overwrite each other
+        if not orchestrator.db_service.append_note_text(doc_id, extra, str(user.get("_id")), is_admin):
+            return ojsonify({"error": "Note not found"}, 404)
+        return ojsonify({"status": "appended", "doc_id": doc_id}, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("append_to_note failed")
+        return ojsonify({"error": str(e)}, 500)
 
 
 @app.route('/notes/<doc_id>/web-diagrams', methods=['POST'])
@@ -551,15 +1115,10 @@ def add_web_diagram(doc_id):
     Request body: {"title": "...", "image_url": "...", "thumbnail": "...", "source": "..."}
     """
     try:
-        data = request.json or {}
+        data = request.get_json(silent=True) or {}
         image_url = (data.get('image_url') or '').strip()
         if not image_url:
-            return jsonify({"error": "image_url is required"}), 400
-
-        # Query directly by doc_id (skip scope filter so older notes without scope field are found)
-        note = orchestrator.db_service.db.notes.find_one({"doc_id": doc_id})
-        if not note:
-            return jsonify({"error": "Note not found"}), 404
+            return ojsonify({"error": "image_url is required"}, 400)
 
         diagram_entry = {
             "title": (data.get('title') or '').strip(),
@@ -568,21 +1127,14 @@ def add_web_diagram(doc_id):
             "source": (data.get('source') or '').strip(),
         }
 
-        # Avoid duplicates by image_url
-        existing = note.get("web_diagrams") or []
-        if any(d.get("image_url") == image_url for d in existing):
-            return jsonify({"status": "already_exists", "doc_id": doc_id, "web_diagrams": existing}), 200
-
-        orchestrator.db_service.db.notes.update_one(
-            {"doc_id": doc_id},
-            {"$push": {"web_diagrams": diagram_entry}}
-        )
-        existing.append(diagram_entry)
-        return jsonify({"status": "added", "doc_id": doc_id, "web_diagrams": existing}), 200
+        # Looked up by doc_id only (no scope filter) so older notes without a scope field are found
+        status, web_diagrams = orchestrator.db_service.add_web_diagram(doc_id, diagram_entry)
+        if status == "not_found":
+            return ojsonify({"error": "Note not found"}, 404)
+        return ojsonify({"status": status, "doc_id": doc_id, "web_diagrams": web_diagrams}, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("add_web_diagram failed")
+        return ojsonify({"error": str(e)}, 500)
 
 
 @app.route('/notes/<doc_id>/web-diagrams/<int:diagram_idx>', methods=['DELETE'])
@@ -590,27 +1142,25 @@ def add_web_diagram(doc_id):
 def remove_web_diagram(doc_id, diagram_idx):
     """Remove a web diagram from the note by its index."""
     try:
-        # Query directly by doc_id (skip scope filter so older notes without scope field are found)
-        note = orchestrator.db_service.db.notes.find_one({"doc_id": doc_id})
-        if not note:
-            return jsonify({"error": "Note not found"}), 404
-
-        existing = note.get("web_diagrams") or []
-        if diagram_idx < 0 or diagram_idx >= len(existing):
-            return jsonify({"error": "Invalid diagram index"}), 400
-
-        existing.pop(diagram_idx)
-        orchestrator.db_service.db.notes.update_one(
-            {"doc_id": doc_id},
-            {"$set": {"web_diagrams": existing}}
-        )
-        return jsonify({"status": "removed", "doc_id": doc_id, "web_diagrams": existing}), 200
+        if diagram_idx < 0:
+            return ojsonify({"error": "Invalid diagram index"}, 400)
+
+        # Looked up by doc_id only (no scope filter) so older notes without a scope field are found
+        status, remaining = orchestrator.db_service.remove_web_diagram(doc_id, diagram_idx)
+        if status == "not_found":
+            return ojsonify({"error": "Note not found"}, 404)
+        if status == "invalid_index":
+            return ojsonify({"error": "Invalid diagram index"}, 400)
+        return ojsonify({"status": "removed", "doc_id": doc_id, "web_diagrams": remaining}, 200)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+        logger.exception("remove_web_diagram failed")
+        return ojsonify({"error": str(e)}, 500)
 
 
 if __name__ == '__main__':
-    port = int(os.getenv('PORT', 5001))
-    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
+    if os.getenv('DEV') == '1':
+        port = int(os.getenv('PORT', 5001))
+        app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False)
+    else:
+        print("The Flask dev server only runs with DEV=1. For production use:")
+        print("  gunicorn -c gunicorn.conf.py wsgi:app")
@@ -9,11 +9,38 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-change-me')
     JWT_EXPIRES_MIN = int(os.getenv('JWT_EXPIRES_MIN', '1440'))
+    # How long a verified token's user stays cached; never past the token's own exp
+    AUTH_CACHE_TTL = min(int(os.getenv('AUTH_CACHE_TTL', '300')), JWT_EXPIRES_MIN * 60)
     ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+    # Argon2id cost; hashes encode their own parameters, so changing these only
+    # affects new hashes (older ones are upgraded on the next successful login)
+    PW_TIME_COST = int(os.getenv('PW_TIME_COST', '2'))
+    PW_MEMORY_COST = int(os.getenv('PW_MEMORY_COST', str(19 * 1024)))  # KiB
+    PW_PARALLELISM = int(os.getenv('PW_PARALLELISM', '1'))
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_UPLOAD_MB', '500')) * 1024 * 1024
+    # Non-file form fields above this size are rejected instead of buffered in RAM
+    MAX_FORM_MEMORY_SIZE = 500 * 1024
+    # Off by default: the warm-up runs in every worker and fills only that worker's cache
+    WARM_QUIZ_CACHE = os.getenv('WARM_QUIZ_CACHE', '0') == '1'
+    WARM_QUIZ_COUNT = int(os.getenv('WARM_QUIZ_COUNT', '15'))
+    # Response compression (flask-compress): Brotli first, gzip for older clients
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+    AUTH_RATE_LIMIT = os.getenv('AUTH_RATE_LIMIT', '10 per minute')
+    # Use a shared backend (e.g. redis://...) when running several gunicorn workers
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
     
     @staticmethod
     def init_app(app):
+        app.config['MAX_CONTENT_LENGTH'] = Config.MAX_CONTENT_LENGTH
+        app.config['MAX_FORM_MEMORY_SIZE'] = Config.MAX_FORM_MEMORY_SIZE
+        app.config['COMPRESS_ALGORITHM'] = Config.COMPRESS_ALGORITHM
+        app.config['COMPRESS_MIN_SIZE'] = Config.COMPRESS_MIN_SIZE
+        app.config['COMPRESS_MIMETYPES'] = ['application/json', 'text/html', 'text/plain']
+        # SSE answers (/question/stream) must reach the client as they are produced
+        app.config['COMPRESS_STREAMS'] = False
+
         if not os.path.exists(Config.UPLOAD_FOLDER):
             os.makedirs(Config.UPLOAD_FOLDER)
             
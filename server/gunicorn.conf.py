@@ -0,0 +1,21 @@
+"""Gunicorn settings for serving the Autonotex backend.
+
+Usage (from server/): gunicorn -c gunicorn.conf.py wsgi:app
+Equivalent CLI: gunicorn -k gthread -w $(nproc) --threads 16 -b 0.0.0.0:5001 --timeout 120 wsgi:app
+gevent instead: GUNICORN_WORKER_CLASS=gevent gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+# One process per core; each one loads its own embedding model, so don't oversubscribe
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# gthread keeps torch/Pinecone/pymongo on real threads; set GUNICORN_WORKER_CLASS=gevent
+# to monkey-patch sockets instead when requests are dominated by LLM waits
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+if worker_class == "gevent":
+    # Concurrent greenlets per worker; gthread ignores this and uses threads instead
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+# Uploads run several LLM calls end to end
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
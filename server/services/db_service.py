@@ -1,16 +1,31 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure
+from pymongo import MongoClient, ReturnDocument
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure, DuplicateKeyError, BulkWriteError
 from datetime import datetime
 import re
 import time
+import threading
+from collections import OrderedDict
 from bson import ObjectId
 
+USER_CACHE_TTL = 60
+USER_CACHE_MAX = 4096
+# Everything auth reads off a user document; both lookups share the cache so they share this too
+USER_PROJECTION = {"email": 1, "password_hash": 1, "role": 1}
+SUBJECT_SEARCH_LIMIT = 50
+# Background job records are shared by every gunicorn worker and expire after this long
+JOB_TTL_SECONDS = 3600
+
 class DBService:
     def __init__(self):
         self.mongo_uri = os.getenv('MONGO_URI')
         self.client = None
         self.db = None
+        self._notes_fast = None
+        # ("id", user_id) / ("email", email) -> (user, expires_at); users rarely change
+        self._user_cache = OrderedDict()
+        self._user_cache_lock = threading.Lock()
         
         if self.mongo_uri:
             try:
@@ -21,12 +36,22 @@ class DBService:
                     connectTimeoutMS=10000,
                     socketTimeoutMS=10000,
                     retryWrites=True,
-                    maxPoolSize=10,
-                    minPoolSize=1
+                    # Sized for gthread workers (16 threads each) plus the job/IO pools
+                    maxPoolSize=int(os.getenv("MONGO_MAX_POOL", "200")),
+                    minPoolSize=int(os.getenv("MONGO_MIN_POOL", "10")),
+                    # Recycle sockets idle for 5 minutes instead of holding them forever
+                    maxIdleTimeMS=300000,
+                    waitQueueTimeoutMS=5000,
+                    # Acknowledged by the primary only; notes are regenerated from uploads anyway
+                    w=1,
+                    # Wire compression for the text-heavy note documents (first supported one wins)
+                    compressors="zstd,snappy,zlib"
                 )
                 # Test connection
                 self.client.admin.command('ping')
                 self.db = self.client.get_database("autonotex_db")
+                # Note saves don't wait for the journal flush; a lost write is regenerated from the upload
+                self._notes_fast = self.db.notes.with_options(write_concern=WriteConcern(w=1, j=False))
                 self._ensure_indexes()
                 print("DBService: Connected to MongoDB Atlas")
             except (ServerSelectionTimeoutError, ConnectionFailure) as e:
@@ -40,11 +65,67 @@ class DBService:
     def _ensure_indexes(self):
         if self.db is None:
             return
+        index_specs = [
+            (self.db.notes, [("created_at", -1)], {}),
+            (self.db.notes, [("scope", 1), ("user_id", 1), ("created_at", -1)], {}),
+            (self.db.notes, [("user_id", 1), ("scope", 1), ("updated_at", -1)], {}),
+            # Private notes are the only ones looked up by owner; shared notes stay out of this index
+            (self.db.notes, [("user_id", 1), ("created_at", -1)], {
+                "name": "notes_private_user_created",
+                "partialFilterExpression": {"scope": "private"}
+            }),
+            (self.db.notes, [("subject", 1), ("user_id", 1)], {}),
+            # Case-folded copy of subject for the prefix fallback in search_notes_by_subject
+            (self.db.notes, [("subject_lc", 1), ("user_id", 1)], {}),
+            # Lets the subjects $group read subject straight from index keys after the scope match
+            (self.db.notes, [("scope", 1), ("user_id", 1), ("subject", 1)], {"name": "notes_scope_user_subject"}),
+            (self.db.notes, [("subject", "text"), ("notes_text", "text"), ("content_summary", "text")], {
+                "name": "notes_text_idx",
+                "weights": {"subject": 10, "notes_text": 3, "content_summary": 1}
+            }),
+            (self.db.users, [("email", 1)], {"unique": True}),
+            (self.db.jobs, [("job_id", 1)], {"unique": True}),
+            (self.db.jobs, [("created_at", 1)], {"expireAfterSeconds": JOB_TTL_SECONDS}),
+        ]
+        # A collection can only have one text index, so retire the old subject-only one
+        try:
+            if "subject_text" in self.db.notes.index_information():
+                self.db.notes.drop_index("subject_text")
+        except Exception as e:
+            print(f"DBService Index Warning (notes subject_text): {e}")
+        self._ensure_unique_doc_id()
+        # Notes saved before subject_lc existed get it filled in once
         try:
-            self.db.notes.create_index([("created_at", -1)])
-            self.db.notes.create_index([("scope", 1), ("user_id", 1), ("created_at", -1)])
+            self.db.notes.update_many(
+                {"subject_lc": {"$exists": False}},
+                [{"$set": {"subject_lc": {"$toLower": "$subject"}}}]
+            )
         except Exception as e:
-            print(f"DBService Index Warning: {e}")
+            print(f"DBService Backfill Warning (notes subject_lc): {e}")
+        # One failure (e.g. duplicate emails blocking the unique index) shouldn't skip the rest
+        for collection, keys, options in index_specs:
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                print(f"DBService Index Warning ({collection.name} {keys}): {e}")
+
+    def _ensure_unique_doc_id(self):
+        """Upgrade the plain doc_id index to a unique sparse one so concurrent upserts can't duplicate a note."""
+        try:
+            info = self.db.notes.index_information()
+            if "notes_doc_id_uniq" in info:
+                return
+            # Same key pattern with different options can't coexist, so the old index goes first
+            if "doc_id_1" in info:
+                self.db.notes.drop_index("doc_id_1")
+            self.db.notes.create_index([("doc_id", 1)], unique=True, sparse=True, name="notes_doc_id_uniq")
+        except Exception as e:
+            # Most likely existing duplicate doc_ids; keep a plain index so lookups stay indexed
+            print(f"DBService Index Warning (notes doc_id unique): {e}")
+            try:
+                self.db.notes.create_index([("doc_id", 1)])
+            except Exception as e:
+                print(f"DBService Index Warning (notes doc_id): {e}")
 
     def save_note(self, note_data, doc_id=None):
         """Save comprehensive note data with subject, diagrams, etc."""
@@ -52,38 +133,27 @@ class DBService:
             print("DBService: No DB connection available. Skipping MongoDB save.")
             return False
 
-        # Extract subject from note_data
-        subject = note_data.get('subject', 'General') if isinstance(note_data, dict) else "General"
-        scope = note_data.get('scope', 'private') if isinstance(note_data, dict) else "private"
-        user_id = note_data.get('user_id') if isinstance(note_data, dict) else None
-
         try:
-            record = {
-                "doc_id": doc_id,
-                "subject": subject,
-                "scope": scope,
-                "user_id": user_id,
-                "content_summary": note_data.get('content', '')[:500] if isinstance(note_data, dict) else str(note_data)[:500],
-                "content_length": len(note_data.get('content', '')) if isinstance(note_data, dict) else len(str(note_data)),
-                "graph_data": note_data.get('graph', {}) if isinstance(note_data, dict) else {},
-                "notes_text": note_data.get('notes', '') if isinstance(note_data, dict) else str(note_data),
-                "questions": note_data.get('questions', []) if isinstance(note_data, dict) else [],
-                "diagrams": note_data.get('diagrams', []) if isinstance(note_data, dict) else [],  # Store diagrams
-                "source_diagrams": note_data.get('source_diagrams', []) if isinstance(note_data, dict) else [],
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
+            record = self._note_record(note_data, doc_id, datetime.utcnow())
+            subject = record["subject"]
+
             if doc_id:
-                # Update if exists, otherwise insert
-                result = self.db.notes.update_one(
-                    {"doc_id": doc_id},
-                    {"$set": record},
-                    upsert=True
-                )
+                # Update if exists, otherwise insert. Two racing upserts can both try the insert;
+                # the unique doc_id index rejects the loser, whose retry then matches and updates.
+                for attempt in range(2):
+                    try:
+                        result = self._notes_fast.update_one(
+                            {"doc_id": doc_id},
+                            {"$set": record},
+                            upsert=True
+                        )
+                        break
+                    except DuplicateKeyError:
+                        if attempt:
+                            raise
                 print(f"DBService: Saved/updated note for subject '{subject}' with {len(record.get('diagrams', []))} diagrams (doc_id: {doc_id})")
             else:
-                self.db.notes.insert_one(record)
+                self._notes_fast.insert_one(record)
                 print(f"DBService: Saved note for subject '{subject}'")
             return True
         except (ServerSelectionTimeoutError, ConnectionFailure) as e:
@@ -94,6 +164,61 @@ class DBService:
             print(f"DBService Save Error: {e}")
             return False
 
+    def save_notes_bulk(self, note_datas: list, doc_ids: list = None) -> int:
+        """
+        Insert several new notes in one unordered insert_many round trip.
+
+        Unlike save_note this never updates: a note whose doc_id already exists is skipped.
+        Returns the number of notes written.
+        """
+        if self.db is None or not note_datas:
+            return 0
+
+        doc_ids = doc_ids or [None] * len(note_datas)
+        now = datetime.utcnow()
+        records = [self._note_record(note_data, doc_id, now) for note_data, doc_id in zip(note_datas, doc_ids)]
+        try:
+            # Unordered, so one duplicate doc_id doesn't stop the rest of the batch
+            result = self._notes_fast.insert_many(records, ordered=False)
+            written = len(result.inserted_ids)
+        except BulkWriteError as e:
+            written = e.details.get("nInserted", 0)
+            print(f"DBService Bulk Save Warning: {len(e.details.get('writeErrors', []))} notes not written")
+        except (ServerSelectionTimeoutError, ConnectionFailure) as e:
+            print(f"DBService Bulk Save Warning: Connection issue - {type(e).__name__}")
+            return 0
+        except Exception as e:
+            print(f"DBService Bulk Save Error: {e}")
+            return 0
+        print(f"DBService: Bulk saved {written}/{len(records)} notes")
+        return written
+
+    def _note_record(self, note_data, doc_id, now: datetime) -> dict:
+        """Build the stored note document shared by save_note and save_notes_bulk."""
+        is_dict = isinstance(note_data, dict)
+        subject = note_data.get('subject', 'General') if is_dict else "General"
+        record = {
+            "doc_id": doc_id,
+            "subject": subject,
+            "subject_lc": str(subject or "").lower(),
+            "scope": note_data.get('scope', 'private') if is_dict else "private",
+            "user_id": note_data.get('user_id') if is_dict else None,
+            "content_summary": note_data.get('content', '')[:500] if is_dict else str(note_data)[:500],
+            "content_length": len(note_data.get('content', '')) if is_dict else len(str(note_data)),
+            "graph_data": note_data.get('graph', {}) if is_dict else {},
+            "notes_text": note_data.get('notes', '') if is_dict else str(note_data),
+            "questions": note_data.get('questions', []) if is_dict else [],
+            "concept_explanations": note_data.get('concept_explanations', {}) if is_dict else {},
+            "diagrams": note_data.get('diagrams', []) if is_dict else [],  # Store diagrams
+            "source_diagrams": note_data.get('source_diagrams', []) if is_dict else [],
+            "created_at": now,
+            "updated_at": now
+        }
+        if not doc_id:
+            # Leave doc_id out rather than storing null, which the sparse unique index would count
+            del record["doc_id"]
+        return record
+
     def get_note_by_id(self, doc_id: str, user_id: str = None, is_admin: bool = False):
         """Retrieve a note by document ID."""
         if self.db is None:
@@ -110,46 +235,110 @@ class DBService:
             print(f"DBService Get Error: {e}")
             return None
 
-    def get_all_notes(self, limit: int = 10, user_id: str = None, is_admin: bool = False):
-        """Get all notes with optional limit."""
+    def get_notes_by_ids(self, doc_ids: list, user_id: str = None, is_admin: bool = False):
+        """Retrieve several notes by document ID in a single query, in the requested order."""
+        if self.db is None or not doc_ids:
+            return []
+        
+        try:
+            query = {"doc_id": {"$in": list(doc_ids)}}
+            scope_filter = self._build_scope_filter(user_id, is_admin)
+            if scope_filter:
+                query.update(scope_filter)
+            notes = {note.get("doc_id"): note for note in self.db.notes.find(query)}
+            return [notes[doc_id] for doc_id in doc_ids if doc_id in notes]
+        except Exception as e:
+            print(f"DBService Get By IDs Error: {e}")
+            return []
+
+    def get_all_notes(self, limit: int = 10, user_id: str = None, is_admin: bool = False, projection: dict = None):
+        """Get all notes with optional limit. Pass ``projection`` to return only those fields."""
         if self.db is None:
             return []
         
         try:
             query = self._build_scope_filter(user_id, is_admin) or {}
-            notes = list(self.db.notes.find(query).sort("created_at", -1).limit(limit))
-            return notes
+            # $sort + $limit coalesce into a top-k sort, so this never needs to spill to disk
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"created_at": -1}},
+                {"$limit": limit}
+            ]
+            pipeline.extend(self._string_id_stages(projection))
+            return list(self.db.notes.aggregate(pipeline, allowDiskUse=False))
         except Exception as e:
             print(f"DBService Get All Error: {e}")
-            try:
-                query = self._build_scope_filter(user_id, is_admin) or {}
-                pipeline = [
-                    {"$match": query},
-                    {"$sort": {"created_at": -1}},
-                    {"$limit": limit}
-                ]
-                notes = list(self.db.notes.aggregate(pipeline, allowDiskUse=True))
-                return notes
-            except Exception as agg_error:
-                print(f"DBService Get All Fallback Error: {agg_error}")
-                return []
+            return []
 
-    def search_notes_by_subject(self, subject: str, user_id: str = None, is_admin: bool = False, scope: str = None):
-        """Search notes by subject."""
+    def get_recently_updated_notes(self, limit: int = 200, user_id: str = None, is_admin: bool = False, scope: str = None, projection: dict = None):
+        """Most recently updated notes that have generated text, filtered and sorted in Mongo."""
         if self.db is None:
             return []
         
         try:
-            query = {"subject": {"$regex": subject, "$options": "i"}}
-            scope_filter = self._build_scope_override(user_id, is_admin, scope) or self._build_scope_filter(user_id, is_admin)
+            scope_query = self._build_scope_override(user_id, is_admin, scope) or self._build_scope_filter(user_id, is_admin)
+            # Older notes only carry the legacy "notes" field
+            has_text = {"$or": [{"notes_text": {"$nin": ["", None]}}, {"notes": {"$nin": ["", None]}}]}
+            # $and because the scope filter can bring its own $or
+            query = {"$and": [scope_query, has_text]} if scope_query else has_text
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"updated_at": -1, "created_at": -1}},
+                {"$limit": limit}
+            ]
+            pipeline.extend(self._string_id_stages(projection))
+            return list(self.db.notes.aggregate(pipeline, allowDiskUse=False))
+        except Exception as e:
+            print(f"DBService Get Recent Error: {e}")
+            return []
+
+    def search_notes_by_subject(self, subject: str, user_id: str = None, is_admin: bool = False, scope: str = None, projection: dict = None):
+        """Search notes by subject, best match first. Pass ``projection`` to return only those fields."""
+        if self.db is None:
+            return []
+        
+        scope_filter = self._build_scope_override(user_id, is_admin, scope) or self._build_scope_filter(user_id, is_admin)
+        try:
+            # Weighted text index first: subject hits outrank body/summary hits, newest breaks ties
+            query = {"$text": {"$search": subject}}
+            if scope_filter:
+                query.update(scope_filter)
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"score": {"$meta": "textScore"}, "updated_at": -1}},
+                {"$limit": SUBJECT_SEARCH_LIMIT}
+            ]
+            pipeline.extend(self._string_id_stages(projection))
+            notes = list(self.db.notes.aggregate(pipeline, allowDiskUse=False))
+            if notes:
+                return notes
+        except Exception as e:
+            print(f"DBService Text Search Warning: {e}")
+
+        try:
+            # Prefix match for partial subjects the text index can't tokenise ("Operat" -> "Operating Systems").
+            # Case-insensitive regexes can't bound an index scan, so match a case-sensitive anchored
+            # prefix against the lowercased copy; escaped so user input can't inject regex syntax.
+            query = {"subject_lc": {"$regex": "^" + re.escape(subject.strip().lower())}}
             if scope_filter:
                 query.update(scope_filter)
-            notes = list(self.db.notes.find(query))
-            return notes
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"updated_at": -1}},
+                {"$limit": SUBJECT_SEARCH_LIMIT}
+            ]
+            pipeline.extend(self._string_id_stages(projection))
+            return list(self.db.notes.aggregate(pipeline, allowDiskUse=False))
         except Exception as e:
             print(f"DBService Search Error: {e}")
             return []
 
+    def _string_id_stages(self, projection: dict = None) -> list:
+        """Pipeline stages returning ``_id`` as a string (plus an optional inclusion projection)."""
+        if projection:
+            return [{"$project": {**projection, "_id": {"$toString": "$_id"}}}]
+        return [{"$set": {"_id": {"$toString": "$_id"}}}]
+
     def get_all_subjects(self, user_id: str = None, is_admin: bool = False, scope: str = None):
         """Get all unique subjects in database."""
         if self.db is None:
@@ -158,18 +347,168 @@ class DBService:
         
         try:
             filter_query = self._build_scope_override(user_id, is_admin, scope) or self._build_scope_filter(user_id, is_admin) or {}
-            subjects = self.db.notes.distinct("subject", filter_query)
+            pipeline = [
+                {"$match": filter_query},
+                # Only indexed fields are referenced, so the plan can be covered by notes_scope_user_subject
+                {"$project": {"_id": 0, "subject": 1}},
+                {"$group": {"_id": "$subject"}}
+            ]
+            subjects = [doc["_id"] for doc in self.db.notes.aggregate(pipeline)]
             print(f"DBService: Found {len(subjects)} subjects: {subjects}")
             return sorted([s for s in subjects if s and str(s).strip()])
         except Exception as e:
             print(f"DBService Get Subjects Error: {e}")
             return []
 
+    def _cached_user(self, key):
+        with self._user_cache_lock:
+            entry = self._user_cache.get(key)
+            if not entry:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._user_cache[key]
+                return None
+            self._user_cache.move_to_end(key)
+            return dict(user)
+
+    def _cache_user(self, user: dict):
+        expires_at = time.time() + USER_CACHE_TTL
+        with self._user_cache_lock:
+            for key in (("id", str(user.get("_id"))), ("email", user.get("email"))):
+                self._user_cache[key] = (dict(user), expires_at)
+                self._user_cache.move_to_end(key)
+            while len(self._user_cache) > USER_CACHE_MAX:
+                self._user_cache.popitem(last=False)
+
+    def invalidate_user(self, user_id: str = None, email: str = None):
+        """Drop a user from the lookup cache under both its id and email keys."""
+        with self._user_cache_lock:
+            for key in ((("id", str(user_id)),) if user_id else ()) + ((("email", email.lower().strip()),) if email else ()):
+                entry = self._user_cache.pop(key, None)
+                if entry:
+                    user = entry[0]
+                    self._user_cache.pop(("id", str(user.get("_id"))), None)
+                    self._user_cache.pop(("email", user.get("email")), None)
+
+    def append_note_text(self, doc_id: str, extra: str, user_id: str = None, is_admin: bool = False) -> bool:
+        """Atomically append text to a note's notes_text/notes. Returns False if no visible note matched."""
+        if self.db is None:
+            return False
+        query = {"doc_id": doc_id}
+        scope_filter = self._build_scope_filter(user_id, is_admin)
+        if scope_filter:
+            query.update(scope_filter)
+        # $literal keeps user text starting with "$" from being read as a field path
+        appended = {"$concat": [
+            {"$ifNull": ["$notes_text", {"$ifNull": ["$notes", ""]}]},
+            "\n\n---\n\n",
+            {"$literal": extra}
+        ]}
+        result = self.db.notes.update_one(query, [{"$set": {"notes_text": appended, "notes": appended}}])
+        return result.matched_count > 0
+
+    def add_web_diagram(self, doc_id: str, diagram_entry: dict):
+        """
+        Push a web diagram unless one with the same image_url is already saved.
+
+        Returns (status, web_diagrams) where status is "added", "already_exists" or "not_found".
+        """
+        if self.db is None:
+            return "not_found", []
+        # The $ne filter makes dedupe and push a single server-side operation
+        updated = self.db.notes.find_one_and_update(
+            {"doc_id": doc_id, "web_diagrams.image_url": {"$ne": diagram_entry.get("image_url")}},
+            {"$push": {"web_diagrams": diagram_entry}},
+            projection={"web_diagrams": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is not None:
+            return "added", updated.get("web_diagrams") or []
+        note = self.db.notes.find_one({"doc_id": doc_id}, {"_id": 0, "web_diagrams": 1})
+        if not note:
+            return "not_found", []
+        return "already_exists", note.get("web_diagrams") or []
+
+    def remove_web_diagram(self, doc_id: str, diagram_idx: int):
+        """
+        Remove the web diagram at ``diagram_idx``.
+
+        Returns (status, remaining_diagrams) where status is "removed", "invalid_index" or "not_found".
+        """
+        if self.db is None:
+            return "not_found", []
+        # $slice on its own still returns every other field; including doc_id makes it an inclusion projection
+        note = self.db.notes.find_one({"doc_id": doc_id}, {"doc_id": 1, "web_diagrams": {"$slice": [diagram_idx, 1]}})
+        if not note:
+            return "not_found", []
+        target = (note.get("web_diagrams") or [None])[0]
+        if not target:
+            return "invalid_index", []
+        # Splice out exactly that position; matching on the element itself makes this a no-op
+        # if a concurrent change shifted the array, and entries sharing an image_url are untouched
+        head = [{"$slice": ["$web_diagrams", 0, diagram_idx]}] if diagram_idx else []
+        tail = {"$slice": ["$web_diagrams", diagram_idx + 1, {"$size": "$web_diagrams"}]}
+        updated = self.db.notes.find_one_and_update(
+            {"doc_id": doc_id, f"web_diagrams.{diagram_idx}": target},
+            [{"$set": {"web_diagrams": {"$concatArrays": head + [tail]}}}],
+            projection={"web_diagrams": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if updated is None:
+            return "invalid_index", []
+        return "removed", updated.get("web_diagrams") or []
+
+    def create_job(self, job_id: str, user_id: str) -> bool:
+        """Record a queued background job so any worker can answer polls for it."""
+        if self.db is None:
+            return False
+        try:
+            self.db.jobs.insert_one({
+                "job_id": job_id,
+                "user_id": user_id,
+                "status": "queued",
+                "result": None,
+                "http_status": None,
+                "error": None,
+                "created_at": datetime.utcnow(),
+                "finished_at": None
+            })
+            return True
+        except Exception as e:
+            print(f"DBService Create Job Error: {e}")
+            return False
+
+    def update_job(self, job_id: str, **fields):
+        if self.db is None:
+            return
+        try:
+            self.db.jobs.update_one({"job_id": job_id}, {"$set": fields})
+        except Exception as e:
+            print(f"DBService Update Job Error: {e}")
+
+    def get_job(self, job_id: str, user_id: str):
+        """Return the job if it belongs to user_id, else None."""
+        if self.db is None:
+            return None
+        try:
+            return self.db.jobs.find_one({"job_id": job_id, "user_id": user_id}, {"_id": 0})
+        except Exception as e:
+            print(f"DBService Get Job Error: {e}")
+            return None
+
     def get_user_by_email(self, email: str):
         if self.db is None or not email:
             return None
+        email = email.lower().strip()
+        cached = self._cached_user(("email", email))
+        if cached:
+            return cached
         try:
-            return self.db.users.find_one({"email": email.lower().strip()})
+            user = self.db.users.find_one({"email": email}, USER_PROJECTION)
+            if user:
+                self._cache_user(user)
+            return user
         except Exception as e:
             print(f"DBService Get User Error: {e}")
             return None
@@ -177,12 +516,32 @@ class DBService:
     def get_user_by_id(self, user_id: str):
         if self.db is None or not user_id:
             return None
+        cached = self._cached_user(("id", str(user_id)))
+        if cached:
+            return cached
         try:
-            return self.db.users.find_one({"_id": ObjectId(user_id)})
+            user = self.db.users.find_one({"_id": ObjectId(user_id)}, USER_PROJECTION)
+            if user:
+                self._cache_user(user)
+            return user
         except Exception as e:
             print(f"DBService Get User By ID Error: {e}")
             return None
 
+    def set_user_role(self, user_id: str, role: str):
+        if self.db is None or not user_id:
+            return False
+        try:
+            result = self.db.users.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": {"role": role}}
+            )
+            self.invalidate_user(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"DBService Set Role Error: {e}")
+            return False
+
     def create_user(self, email: str, password_hash: str, role: str = "user"):
         if self.db is None:
             return None
@@ -200,6 +559,20 @@ class DBService:
             print(f"DBService Create User Error: {e}")
             return None
 
+    def update_user_password_hash(self, user_id: str, password_hash: str):
+        if self.db is None or not user_id:
+            return False
+        try:
+            result = self.db.users.update_one(
+                {"_id": ObjectId(user_id)},
+                {"$set": {"password_hash": password_hash}}
+            )
+            self.invalidate_user(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"DBService Update Password Error: {e}")
+            return False
+
     def _build_scope_filter(self, user_id: str = None, is_admin: bool = False) -> dict:
         if is_admin:
             return {}
@@ -0,0 +1,85 @@
+"""In-process cache for sentence embeddings.
+
+Vectors are stored int8-quantized with a per-vector scale, which is a quarter
+of the fp32 footprint and well within cosine-similarity tolerance for search.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, maxsize: int = 20000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (int8 vector, scale)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.strip().lower().encode(), digest_size=16).digest()
+
+    def get(self, text: str):
+        """Return the cached float32 embedding for text, or None."""
+        return self.get_many([self.key(text)])[0]
+
+    def get_many(self, keys: list) -> list:
+        """Look up several precomputed keys under one lock; misses come back as None."""
+        entries = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                entries.append(entry)
+        return [None if entry is None else entry[0].astype(np.float32) * entry[1] for entry in entries]
+
+    def put(self, text: str, vector, key: bytes = None):
+        vector = np.asarray(vector, dtype=np.float32)
+        max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+        scale = max_abs / 127 if max_abs else 1.0
+        quantized = np.round(vector / scale).astype(np.int8)
+        if key is None:
+            key = self.key(text)
+        with self._lock:
+            self._entries[key] = (quantized, scale)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class CachedEmbedder:
+    """Drop-in for SentenceTransformer.encode that only embeds texts it hasn't seen."""
+
+    def __init__(self, model, cache: EmbeddingCache, **encode_defaults):
+        self.model = model
+        self.cache = cache
+        # Applied to every model.encode call unless the caller overrides them
+        self.encode_defaults = encode_defaults
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        # Hash each text once and reuse the key for the store after encoding the misses
+        keys = [self.cache.key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = self.model.encode([texts[i] for i in missing], **{**self.encode_defaults, **kwargs})
+            for i, vec in zip(missing, fresh):
+                vec = np.asarray(vec, dtype=np.float32)
+                self.cache.put(texts[i], vec, key=keys[i])
+                vectors[i] = vec
+
+        dim = self.get_sentence_embedding_dimension()
+        result = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, dim), dtype=np.float32)
+        if normalize_embeddings and len(result):
+            norms = np.linalg.norm(result, axis=1, keepdims=True)
+            result = result / np.where(norms == 0, 1, norms)
+        return result[0] if single else result
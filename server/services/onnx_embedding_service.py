@@ -0,0 +1,84 @@
+"""Int8-quantized ONNX Runtime backend for the sentence embedding model.
+
+Needs the optional ``optimum[onnxruntime]`` package. Export and quantize once
+(from server/):
+
+    python -m services.onnx_embedding_service onnx_model
+
+then start the server with EMBEDDING_ONNX_DIR=onnx_model. Dynamic int8
+quantization lets ONNX Runtime use VNNI int8 dot products on x86, which is
+several times faster than the fp32 torch model on CPU with negligible loss
+for cosine retrieval. VectorDBService falls back to the torch model when the
+directory or the optional packages are missing.
+"""
+
+import sys
+
+import numpy as np
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer
+
+QUANTIZED_FILE = "model_quantized.onnx"
+MAX_SEQ_LENGTH = 256
+
+
+class OnnxEmbedder:
+    """Mean-pooled ONNX embedder exposing the subset of SentenceTransformer that CachedEmbedder uses."""
+
+    def __init__(self, model_dir: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir,
+            file_name=QUANTIZED_FILE,
+            provider="CPUExecutionProvider"
+        )
+        self._dimension = self.model.config.hidden_size
+
+    def get_sentence_embedding_dimension(self):
+        return self._dimension
+
+    def encode(self, sentences, batch_size: int = 64, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self._dimension), dtype=np.float32)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            # Mean pooling over real tokens, as the sentence-transformers pooling layer does
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+
+        embeddings = np.vstack(batches)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.where(norms == 0, 1, norms)
+        return embeddings[0] if single else embeddings
+
+
+def export_quantized(model_name: str, out_dir: str):
+    """Export model_name to ONNX and write a dynamically int8-quantized copy into out_dir."""
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(out_dir)
+
+    quantizer = ORTQuantizer.from_pretrained(out_dir)
+    config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=out_dir, quantization_config=config)
+    print(f"OnnxEmbeddingService: Wrote {out_dir}/{QUANTIZED_FILE}")
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else "onnx_model"
+    name = sys.argv[2] if len(sys.argv) > 2 else "sentence-transformers/all-MiniLM-L6-v2"
+    export_quantized(name, out)
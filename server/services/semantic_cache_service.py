@@ -0,0 +1,138 @@
+"""Semantic response cache for RAG endpoints.
+
+Queries are embedded, bucketed by a random-projection LSH signature, and a
+stored response is reused when a new query in the same bucket is close
+enough in cosine similarity.
+
+The cache is per process: with several gunicorn workers each one holds its own
+copy, and evict_doc()/clear() only reach the worker they are called in. Other
+workers keep serving their entries until the TTL expires, so ttl_seconds bounds
+how stale an answer can be after an upload or delete.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCacheService:
+    def __init__(
+        self,
+        embedding_model,
+        threshold: float = 0.95,
+        ttl_seconds: int = 600,
+        num_planes: int = 8,
+        max_per_bucket: int = 32,
+        max_entries: int = 4096,
+        seed: int = 42
+    ):
+        """
+        Args:
+            embedding_model: SentenceTransformer used to embed queries
+            threshold: Minimum cosine similarity for a cache hit
+            ttl_seconds: How long a stored response stays valid
+            num_planes: Number of random hyperplanes (signature bits)
+            max_per_bucket: Oldest entries beyond this are dropped per bucket
+            max_entries: Total entries across all buckets; least recently used buckets go first
+        """
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_per_bucket = max_per_bucket
+        self.max_entries = max_entries
+
+        dim = embedding_model.get_sentence_embedding_dimension() if embedding_model else 0
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((dim, num_planes)).astype(np.float32)
+
+        self._buckets = OrderedDict()  # (user_id, scope, signature) -> [entry], least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, query: str, user_id: str, scope: str):
+        """Return a stored response for a semantically equivalent query, or None."""
+        if not self.embedding_model or not query:
+            return None
+        vector = self._embed(query)
+        key = (user_id, scope, self._signature(vector))
+        now = time.time()
+
+        with self._lock:
+            entries = self._prune_bucket(key, now)
+            if not entries:
+                return None
+            self._buckets.move_to_end(key)
+            best = None
+            for entry in entries:
+                if float(entry["vector"] @ vector) >= self.threshold:
+                    if best is None or entry["created_at"] > best["created_at"]:
+                        best = entry
+            return copy.deepcopy(best["response"]) if best else None
+
+    def put(self, query: str, user_id: str, scope: str, response, doc_ids=None):
+        """Store a response along with the doc_ids it was built from."""
+        if not self.embedding_model or not query:
+            return
+        vector = self._embed(query)
+        key = (user_id, scope, self._signature(vector))
+        entry = {
+            "vector": vector,
+            "response": copy.deepcopy(response),
+            "doc_ids": set(doc_ids or []),
+            "created_at": time.time()
+        }
+        with self._lock:
+            bucket = self._prune_bucket(key, entry["created_at"])
+            if bucket is None:
+                bucket = self._buckets[key] = []
+            bucket.append(entry)
+            self._size += 1
+            if len(bucket) > self.max_per_bucket:
+                dropped = len(bucket) - self.max_per_bucket
+                del bucket[:dropped]
+                self._size -= dropped
+            self._buckets.move_to_end(key)
+            while self._size > self.max_entries and len(self._buckets) > 1:
+                _, evicted = self._buckets.popitem(last=False)
+                self._size -= len(evicted)
+
+    def evict_doc(self, doc_id: str):
+        """Drop every cached response that was built from *doc_id*."""
+        with self._lock:
+            for key in list(self._buckets):
+                entries = self._buckets[key]
+                kept = [e for e in entries if doc_id not in e["doc_ids"]]
+                self._size -= len(entries) - len(kept)
+                if kept:
+                    self._buckets[key] = kept
+                else:
+                    del self._buckets[key]
+
+    def clear(self):
+        """Drop everything, e.g. after new content is indexed."""
+        with self._lock:
+            self._buckets.clear()
+            self._size = 0
+
+    def _prune_bucket(self, key, now: float):
+        """Drop expired entries from a bucket (removing it if empty); caller holds the lock."""
+        entries = self._buckets.get(key)
+        if entries is None:
+            return None
+        live = [e for e in entries if now - e["created_at"] < self.ttl_seconds]
+        self._size -= len(entries) - len(live)
+        if not live:
+            del self._buckets[key]
+            return None
+        self._buckets[key] = live
+        return live
+
+    def _embed(self, query: str) -> np.ndarray:
+        return self.embedding_model.encode([query], normalize_embeddings=True)[0].astype(np.float32)
+
+    def _signature(self, vector: np.ndarray) -> int:
+        bits = (vector @ self.planes) > 0
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
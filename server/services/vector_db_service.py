@@ -1,11 +1,69 @@
 import os
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
+import torch
 from datetime import datetime
 from pinecone import Pinecone, ServerlessSpec
 import json
 import re
-from difflib import SequenceMatcher
+import numpy as np
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datasketch import MinHash, MinHashLSH
+from services.embedding_cache_service import EmbeddingCache, CachedEmbedder
+
+ENCODE_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+NEAR_DUP_THRESHOLD = 0.92
+MINHASH_PERMUTATIONS = 64
+SHINGLE_WORDS = 5
+QUERY_VECTOR_CACHE_SIZE = 1024
+# Paraphrased chunks the shingle check misses still land this close in embedding space
+NEAR_DUP_EMBEDDING_SIMILARITY = 0.95
+EMBEDDING_DEDUPE_BLOCK = 512
+# Pinecone caps upserts at ~100 vectors / 2MB per request
+UPSERT_BATCH_SIZE = 100
+UPSERT_WORKERS = 4
+# Background embed+upsert jobs; two keep the model busy without starving request threads
+INDEX_WORKERS = int(os.getenv("VECTOR_INDEX_WORKERS", "2"))
+
+# (model name, device, onnx dir) -> embedding model; every VectorDBService in the process shares the weights
+_MODEL_CACHE = {}
+_MODEL_CACHE_LOCK = threading.Lock()
+
+
+def _load_onnx_model(onnx_dir: str):
+    try:
+        from services.onnx_embedding_service import OnnxEmbedder
+        model = OnnxEmbedder(onnx_dir)
+        print(f"VectorDBService: Using int8 ONNX embedder from {onnx_dir}")
+        return model
+    except Exception as e:
+        print(f"VectorDBService: ONNX embedder unavailable ({e}), falling back to torch")
+        return None
+
+
+def _load_embedding_model(name: str, device: str, onnx_dir: str = None):
+    key = (name, device, onnx_dir)
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is None and onnx_dir and device == "cpu":
+            model = _load_onnx_model(onnx_dir)
+        if model is None:
+            model = SentenceTransformer(name, device=device)
+            if device == "cuda":
+                # Half precision doubles GPU throughput; cached vectors are stored as float32 regardless
+                model.half()
+        _MODEL_CACHE[key] = model
+        return model
+
+
+_NON_ALNUM = re.compile(r"[^a-z0-9\s]")
+_WS = re.compile(r"\s+")
+# ASCII punctuation -> space as a C-level table lookup; the regex only runs for non-ASCII text
+_ASCII_PUNCT_TO_SPACE = str.maketrans({
+    c: " " for c in map(chr, range(128)) if not (c.isalnum() or c.isspace())
+})
 
 class VectorDBService:
     def __init__(self):
@@ -43,7 +101,25 @@ class VectorDBService:
                 self.pc = None
                 self.index = None
 
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        # EMBEDDING_ONNX_DIR points at an export from services/onnx_embedding_service.py (CPU only)
+        self.embedding_model = _load_embedding_model(
+            self.embedding_model_name, device, os.getenv("EMBEDDING_ONNX_DIR")
+        )
+        # Repeated queries and re-uploaded chunks reuse their embeddings instead of re-encoding
+        self.embedder = CachedEmbedder(
+            self.embedding_model,
+            EmbeddingCache(int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))),
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+        # (model, query) -> ready-to-send list; skips dequantising and tolist() for hot queries
+        self._query_vectors = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
+
+        self._index_pool = ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix="vector-index")
 
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
@@ -53,9 +129,18 @@ class VectorDBService:
 
         print("VectorDBService: Initialized successfully")
 
-    def add_document(self, content: str, metadata: dict, doc_id: str) -> list:
+    def chunk_text(self, content: str) -> list:
+        """Split content into deduplicated chunks ready for embedding."""
+        if not content:
+            return []
+        return self._dedupe_chunks(self.text_splitter.split_text(content))
+
+    def add_document(self, content: str, metadata: dict, doc_id: str, chunks: list = None, raise_errors: bool = False) -> list:
         """
         Add document to vector DB with semantic chunking.
+
+        Pass pre-computed ``chunks`` (from ``chunk_text``) to avoid re-splitting the content.
+        With ``raise_errors`` a failed embed/upsert raises instead of returning [].
         """
         if not self.index:
             print("VectorDBService: Vector DB not available, skipping document storage")
@@ -63,79 +148,121 @@ class VectorDBService:
         
         try:
             # Split content into meaningful chunks
-            chunks = self.text_splitter.split_text(content)
-            chunks = self._dedupe_chunks(chunks)
+            if chunks is None:
+                chunks = self.chunk_text(content)
             if not chunks:
                 return []
 
-            embeddings = self.embedding_model.encode(chunks).tolist()
-            chunk_ids = []
-            vectors = []
+            # Stays a numpy matrix; rows are only turned into lists for the Pinecone tuples
+            embeddings = self.embedder.encode(chunks, normalize_embeddings=True)
+            chunks, embeddings = self._dedupe_by_embedding(chunks, embeddings)
+            chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
+            vectors = [None] * len(chunks)
+            added_at = datetime.utcnow().isoformat()
 
             for i, (chunk, vector) in enumerate(zip(chunks, embeddings)):
-                chunk_id = f"{doc_id}_chunk_{i}"
-                chunk_ids.append(chunk_id)
-                vectors.append((
-                    chunk_id,
-                    vector,
+                vectors[i] = (
+                    chunk_ids[i],
+                    vector.tolist(),
                     {
                         **metadata,
                         "content": chunk,
                         "chunk_index": i,
                         "total_chunks": len(chunks),
-                        "added_at": datetime.utcnow().isoformat()
+                        "added_at": added_at
                     }
-                ))
+                )
 
-            self.index.upsert(vectors=vectors, namespace="notes")
+            self._upsert_batched(vectors, "notes")
 
             print(f"VectorDBService: Added {len(chunks)} chunks for document {doc_id}")
             return chunk_ids
         except Exception as e:
             print(f"VectorDBService Error adding document: {e}")
+            if raise_errors:
+                raise
             return []
 
+    def add_document_async(self, content: str, metadata: dict, doc_id: str, chunks: list = None):
+        """Queue ``add_document`` on the indexing pool; returns a Future of the chunk IDs that fails if indexing does."""
+        return self._index_pool.submit(self.add_document, content, metadata, doc_id, chunks, True)
+
+    def add_concepts_async(self, concepts: list, metadata: dict, doc_id: str):
+        """Queue ``add_concepts`` on the indexing pool; returns a Future of the concept IDs that fails if indexing does."""
+        return self._index_pool.submit(self.add_concepts, concepts, metadata, doc_id, True)
+
+    def _upsert_batched(self, vectors: list, namespace: str):
+        """Upsert in request-sized batches, sent concurrently; re-raises the first failure."""
+        batches = [vectors[i:i + UPSERT_BATCH_SIZE] for i in range(0, len(vectors), UPSERT_BATCH_SIZE)]
+        if len(batches) <= 1:
+            for batch in batches:
+                self.index.upsert(vectors=batch, namespace=namespace)
+            return
+        with ThreadPoolExecutor(max_workers=min(UPSERT_WORKERS, len(batches))) as executor:
+            futures = [executor.submit(self.index.upsert, vectors=batch, namespace=namespace) for batch in batches]
+            for future in as_completed(futures):
+                future.result()
+
+    def _dedupe_by_embedding(self, chunks: list, embeddings: np.ndarray) -> tuple:
+        """Drop chunks whose normalized embedding is a near-duplicate of an earlier kept chunk."""
+        count = len(chunks)
+        keep = np.ones(count, dtype=bool)
+        # One matmul per block of rows against everything before it keeps memory at block x N
+        for start in range(0, count, EMBEDDING_DEDUPE_BLOCK):
+            end = min(start + EMBEDDING_DEDUPE_BLOCK, count)
+            sims = embeddings[start:end] @ embeddings[:end].T
+            for i in range(max(start, 1), end):
+                if sims[i - start, :i][keep[:i]].max(initial=-1.0) >= NEAR_DUP_EMBEDDING_SIMILARITY:
+                    keep[i] = False
+
+        if keep.all():
+            return chunks, embeddings
+        print(f"VectorDBService: Dropped {count - int(keep.sum())} near-duplicate chunks by embedding")
+        return [chunk for chunk, kept in zip(chunks, keep) if kept], embeddings[keep]
+
     def _dedupe_chunks(self, chunks: list) -> list:
+        # Exact repeats are caught by hash; near-duplicates by MinHash LSH over word shingles,
+        # which is a bucket lookup per chunk instead of a pairwise SequenceMatcher scan
         seen = set()
         kept = []
-        recent = []
-        max_recent = 50
+        lsh = MinHashLSH(threshold=NEAR_DUP_THRESHOLD, num_perm=MINHASH_PERMUTATIONS)
 
-        for chunk in chunks:
+        for i, chunk in enumerate(chunks):
             normalized = self._normalize_text(chunk)
             if not normalized:
                 continue
 
-            if normalized in seen:
+            key = hash(normalized)
+            if key in seen:
                 continue
 
-            is_near_duplicate = False
-            for prev in recent:
-                if SequenceMatcher(None, normalized, prev).ratio() >= 0.92:
-                    is_near_duplicate = True
-                    break
-
-            if is_near_duplicate:
+            minhash = MinHash(num_perm=MINHASH_PERMUTATIONS)
+            minhash.update_batch(self._shingles(normalized))
+            if lsh.query(minhash):
                 continue
 
-            seen.add(normalized)
+            seen.add(key)
+            lsh.insert(str(i), minhash)
             kept.append(chunk)
-            recent.append(normalized)
-            if len(recent) > max_recent:
-                recent.pop(0)
 
         removed = len(chunks) - len(kept)
         if removed > 0:
             print(f"VectorDBService: Deduped {removed} duplicate chunks")
         return kept
 
+    def _shingles(self, normalized: str) -> list:
+        words = normalized.split()
+        if len(words) <= SHINGLE_WORDS:
+            return [normalized.encode()]
+        return [" ".join(words[i:i + SHINGLE_WORDS]).encode() for i in range(len(words) - SHINGLE_WORDS + 1)]
+
     def _normalize_text(self, text: str) -> str:
-        lowered = text.lower()
-        lowered = re.sub(r"[^a-z0-9\s]", " ", lowered)
-        lowered = re.sub(r"\s+", " ", lowered).strip()
-        return lowered
+        lowered = text.lower().translate(_ASCII_PUNCT_TO_SPACE)
+        if not lowered.isascii():
+            lowered = _NON_ALNUM.sub(" ", lowered)
+        return _WS.sub(" ", lowered).strip()
 
-    def add_concepts(self, concepts: list, metadata: dict, doc_id: str) -> list:
+    def add_concepts(self, concepts: list, metadata: dict, doc_id: str, raise_errors: bool = False) -> list:
         """
         Add extracted concepts to vector DB.
         
@@ -145,8 +272,12 @@ class VectorDBService:
             doc_id: Document identifier
             
         Returns:
-            List of concept IDs added
+            List of concept IDs added (a failure raises instead when ``raise_errors`` is set)
         """
+        if not self.index:
+            print("VectorDBService: Vector DB not available, skipping concept storage")
+            return []
+
         try:
             if not concepts:
                 return []
@@ -161,31 +292,50 @@ class VectorDBService:
                 description = f"{concept.get('label', '')}: {concept.get('description', '')}"
                 descriptions.append(description)
 
-            embeddings = self.embedding_model.encode(descriptions).tolist()
+            embeddings = self.embedder.encode(descriptions, normalize_embeddings=True)
+            added_at = datetime.utcnow().isoformat()
 
             for i, (concept, vector) in enumerate(zip(concepts, embeddings)):
                 concept_id = concept_ids[i]
                 description = descriptions[i]
                 vectors.append((
                     concept_id,
-                    vector,
+                    vector.tolist(),
                     {
                         **metadata,
                         "content": description,
                         "concept_label": concept.get('label', ''),
                         "concept_type": concept.get('type', 'general'),
-                        "added_at": datetime.utcnow().isoformat()
+                        "added_at": added_at
                     }
                 ))
 
-            self.index.upsert(vectors=vectors, namespace="concepts")
+            self._upsert_batched(vectors, "concepts")
 
             print(f"VectorDBService: Added {len(concept_ids)} concepts")
             return concept_ids
         except Exception as e:
             print(f"VectorDBService Error adding concepts: {e}")
+            if raise_errors:
+                raise
             return []
 
+    def embed_query(self, query: str) -> list:
+        """Embed a search query, reusing the cached vector for repeated queries."""
+        key = (self.embedding_model_name, query)
+        with self._query_vectors_lock:
+            vector = self._query_vectors.get(key)
+            if vector is not None:
+                self._query_vectors.move_to_end(key)
+                return vector
+
+        vector = self.embedder.encode([query])[0].tolist()
+        with self._query_vectors_lock:
+            self._query_vectors[key] = vector
+            while len(self._query_vectors) > QUERY_VECTOR_CACHE_SIZE:
+                self._query_vectors.popitem(last=False)
+        return vector
+
     def semantic_search(
         self,
         query: str,
@@ -207,7 +357,7 @@ class VectorDBService:
             List of relevant chunks/concepts with metadata
         """
         try:
-            vector = self.embedding_model.encode([query]).tolist()[0]
+            vector = self.embed_query(query)
             query_kwargs = {
                 "vector": vector,
                 "top_k": n_results,
@@ -262,23 +412,19 @@ class VectorDBService:
     def get_document_summary(self, doc_id: str) -> dict:
         """Get all chunks for a document with context."""
         try:
-            vector = self.embedding_model.encode([doc_id]).tolist()[0]
-            results = self.index.query(
-                vector=vector,
-                top_k=100,
-                include_metadata=True,
-                namespace="notes",
-                filter={"doc_id": {"$eq": doc_id}}
-            )
-
+            # Chunk IDs are "<doc_id>_chunk_<i>", so list-by-prefix + fetch is exact and needs no query vector
             chunks = []
-            for match in results.get("matches", []):
-                metadata = match.get("metadata", {}) or {}
-                chunks.append({
-                    "chunk_index": metadata.get("chunk_index", 0),
-                    "content": metadata.get("content", ""),
-                    "metadata": metadata
-                })
+            for ids in self.index.list(prefix=f"{doc_id}_chunk_", namespace="notes"):
+                if not ids:
+                    continue
+                fetched = self.index.fetch(ids=list(ids), namespace="notes")
+                for vector in fetched.vectors.values():
+                    metadata = vector.metadata or {}
+                    chunks.append({
+                        "chunk_index": metadata.get("chunk_index", 0),
+                        "content": metadata.get("content", ""),
+                        "metadata": metadata
+                    })
 
             chunks.sort(key=lambda x: x["chunk_index"])
             return {
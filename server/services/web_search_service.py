@@ -3,6 +3,7 @@
 from __future__ import annotations
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 
 from ddgs import DDGS
@@ -14,14 +15,16 @@ class WebSearchService:
 
     def __init__(self, groq_client=None):
         self.groq_client = groq_client
+        # One long-lived client: DDGS caches its engine instances (and their
+        # HTTP connection pools), which a per-call ``with DDGS()`` throws away
+        self._ddgs = DDGS()
 
     # ── public API ───────────────────────────────────────────
 
     def search(self, query: str, max_results: int = 6) -> List[dict]:
         """Return a list of {title, url, snippet} dicts from DuckDuckGo."""
         try:
-            with DDGS() as ddgs:
-                results = list(ddgs.text(query, max_results=max_results))
+            results = list(self._ddgs.text(query, max_results=max_results))
             return [
                 {
                     "title": r.get("title", ""),
@@ -34,80 +37,134 @@ class WebSearchService:
             print(f"WebSearchService: Search error – {e}")
             return []
 
+    def search_bundle(
+        self,
+        query: str,
+        max_results: int = 6,
+        max_images: int = 12,
+    ) -> tuple:
+        """Run the text and image searches concurrently.
+
+        Returns ``(results, images)``; both are I/O-bound DuckDuckGo calls.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            text_future = executor.submit(self.search, query, max_results)
+            image_future = executor.submit(self.search_images, query, max_images)
+            return text_future.result(), image_future.result()
+
     def search_and_summarise(
         self,
         concept: str,
         context_hint: str = "",
         max_results: int = 6,
+        include_images: bool = False,
     ) -> dict:
         """Search the web for *concept*, then use the LLM to turn the
         snippets into concise, study-friendly markdown notes.
 
-        Returns ``{"concept", "search_results", "summary"}``.
+        Returns ``{"concept", "search_results", "summary"}``, plus ``"images"``
+        when *include_images* is set.
         """
-        results = self.search(f"{concept} {context_hint}".strip(), max_results)
+        query = f"{concept} {context_hint}".strip()
+        if include_images:
+            results, images = self.search_bundle(query, max_results)
+        else:
+            results, images = self.search(query, max_results), None
 
         if not results:
-            return {
-                "concept": concept,
-                "search_results": [],
-                "summary": f"No web results found for **{concept}**.",
-            }
-
-        summary = self._summarise(concept, results) if self.groq_client else self._plain_summary(concept, results)
+            summary = f"No web results found for **{concept}**."
+        else:
+            summary = self._summarise(concept, results) if self.groq_client else self._plain_summary(concept, results)
 
-        return {
+        response = {
             "concept": concept,
             "search_results": results,
             "summary": summary,
         }
+        if include_images:
+            response["images"] = images
+        return response
 
-    # ── internal helpers ─────────────────────────────────────
+    def stream_search_and_summarise(
+        self,
+        concept: str,
+        context_hint: str = "",
+        max_results: int = 6,
+    ):
+        """Like :meth:`search_and_summarise`, but yields ``(event, payload)``
+        pairs: ``"results"`` with the search hits, ``"delta"`` pieces of the
+        summary as they arrive, then ``"done"``."""
+        results = self.search(f"{concept} {context_hint}".strip(), max_results)
+        yield "results", {"concept": concept, "search_results": results}
 
-    def _summarise(self, concept: str, results: list) -> str:
-        """Use Groq to produce markdown study notes from search snippets."""
-        from agents.base_agent import rate_limit_retry
+        if not results:
+            yield "delta", f"No web results found for **{concept}**."
+        elif self.groq_client:
+            for delta in self._summarise_streaming(concept, results):
+                yield "delta", delta
+        else:
+            yield "delta", self._plain_summary(concept, results)
+        yield "done", {"concept": concept}
 
+    # ── internal helpers ─────────────────────────────────────
+
+    def _summary_request(self, concept: str, results: list) -> dict:
         snippets_text = "\n\n".join(
             f"**{r['title']}**\n{r['snippet']}\nSource: {r['url']}"
             for r in results
         )
+        return dict(
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a study-notes assistant. "
+                        "Given web search snippets about a concept, produce concise, "
+                        "well-structured Markdown notes the student can paste into "
+                        "their existing notes. "
+                        "Include key definitions, important points, and cite sources "
+                        "as inline links. Keep it under 600 words."
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": (
+                        f"Concept: **{concept}**\n\n"
+                        f"Web search results:\n\n{snippets_text}\n\n"
+                        "Produce study notes in Markdown."
+                    ),
+                },
+            ],
+            model="llama-3.3-70b-versatile",
+            temperature=0.4,
+            max_tokens=1500,
+        )
+
+    def _summarise(self, concept: str, results: list) -> str:
+        """Use Groq to produce markdown study notes from search snippets."""
+        return "".join(self._summarise_streaming(concept, results))
 
+    def _summarise_streaming(self, concept: str, results: list):
+        """Yield the Groq study notes as they are generated."""
+        from agents.base_agent import rate_limit_retry
+
+        emitted = False
         try:
             completion = rate_limit_retry(
                 self.groq_client,
-                dict(
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": (
-                                "You are a study-notes assistant. "
-                                "Given web search snippets about a concept, produce concise, "
-                                "well-structured Markdown notes the student can paste into "
-                                "their existing notes. "
-                                "Include key definitions, important points, and cite sources "
-                                "as inline links. Keep it under 600 words."
-                            ),
-                        },
-                        {
-                            "role": "user",
-                            "content": (
-                                f"Concept: **{concept}**\n\n"
-                                f"Web search results:\n\n{snippets_text}\n\n"
-                                "Produce study notes in Markdown."
-                            ),
-                        },
-                    ],
-                    model="llama-3.3-70b-versatile",
-                    temperature=0.4,
-                    max_tokens=1500,
-                ),
+                {**self._summary_request(concept, results), "stream": True},
                 agent_name="WebSearch",
             )
-            return completion.choices[0].message.content
+            for chunk in completion:
+                delta = chunk.choices[0].delta.content or ""
+                if delta:
+                    emitted = True
+                    yield delta
         except Exception as e:
             print(f"WebSearchService: Summarise error – {e}")
-            return self._plain_summary(concept, results)
+            # Only fall back when nothing was sent yet; a half-streamed summary can't be replaced
+            if not emitted:
+                yield self._plain_summary(concept, results)
 
     def search_images(
         self,
@@ -119,13 +176,12 @@ class WebSearchService:
         Returns a list of ``{title, image_url, thumbnail, source, width, height}``.
         """
         try:
-            with DDGS() as ddgs:
-                raw = list(
-                    ddgs.images(
-                        f"{query} diagram",
-                        max_results=max_results,
-                    )
+            raw = list(
+                self._ddgs.images(
+                    f"{query} diagram",
+                    max_results=max_results,
                 )
+            )
             return [
                 {
                     "title": r.get("title", ""),
@@ -0,0 +1,11 @@
+"""WSGI entrypoint for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn.conf.py defaults to gthread workers (one per core, 16 threads each).
+For LLM-heavy traffic, GUNICORN_WORKER_CLASS=gevent switches to gevent workers;
+gunicorn's gevent worker monkey-patches sockets itself before loading this module.
+"""
+from app import app
+
+__all__ = ["app"]